@@ -3,14 +3,269 @@
 # Represents a Micron Sonar ensemble.
 #   2020-03-13  zduguid@mit.edu         initial implementation 
 
-import datetime
-import dateutil
+import csv
 import math
 import numpy as np
-import pandas as pd 
+from numpy.lib.stride_tricks import sliding_window_view
 from MicronSonar import MicronSonar
 
+# numba is optional, when it is installed the peak width is computed with a
+# compiled kernel, otherwise the NumPy implementation is used 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# the peak width kernel can also be compiled ahead of time by running 
+# build_kernels.py, which avoids the compile time on the first ensemble
+try:
+    import micron_kernels
+except ImportError:
+    micron_kernels = None
+
+
+
+def _peak_width_numpy(intensity, max_bin_index, roll_len, conv_len):
+    """Computes the start and end bins of the dominant peak with NumPy
+
+    See MicronEnsemble.get_peak_width() for a description of the method.
+
+    Args:
+        intensity: float array of the intensity bins of the ensemble.
+        max_bin_index: bin location of the maximum intensity value.
+        roll_len: window length of the centered rolling median.
+        conv_len: kernel length of the convolution filter.
+
+    Returns:
+        Tuple of (peak_start_bin, peak_end_bin).
+    """
+    # get width of values that satisfy the threshold
+    #   - centered rolling median, bins without a full window are zero
+    windows  = sliding_window_view(intensity, roll_len)
+    roll_pad = roll_len // 2
+    bin_roll = np.zeros(len(intensity))
+    bin_roll[roll_pad : roll_pad + len(windows)] = np.median(windows, axis=1)
+    
+    # threshold the array based on half of the maximum intensity 
+    half_max      = np.max(bin_roll) / 2
+    bin_threshold = (bin_roll >= half_max).astype(np.uint8)
+    
+    # convolve the threshold array to account for narrow valleys 
+    #   - moving window sum using a cumulative sum, which is the same as 
+    #     np.convolve() with a kernel of ones in 'same' mode
+    #   - the cumulative sum can exceed the uint8 range, so it uses int32
+    bin_cumsum    = np.cumsum(np.concatenate((
+        np.zeros(conv_len//2 + 1, dtype=np.uint8), 
+        bin_threshold, 
+        np.zeros((conv_len-1)//2, dtype=np.uint8))), dtype=np.int32)
+    bin_threshold = (bin_cumsum[conv_len:] - bin_cumsum[:-conv_len]) > 0
+    
+    # extract the start and end peak values on either side of the maximum
+    if (max_bin_index == 0) or (max_bin_index >= len(bin_threshold)):
+        peak_start_bin = np.nan
+        peak_end_bin   = np.nan 
+    else:
+        peak_start_bin, peak_end_bin = _scan_bits(bin_threshold, max_bin_index)
+    
+    return peak_start_bin, peak_end_bin
+
+
+
+def _scan_bits(peak, start):
+    """Finds both edges of the run of peak bins around start
+
+    Same result as _scan_left() and _scan_right(), for use without numba. The
+    peak array is packed into one Python integer (bit i is bin i) so that 
+    each edge is found with a few integer operations on whole machine words
+    instead of an interpreted loop over the bins.
+
+    Args:
+        peak: boolean array, true for the bins that are part of a peak.
+        start: bin to scan from, see _scan_left() and _scan_right().
+
+    Returns:
+        Tuple of (peak_start_bin, peak_end_bin), see _scan_left() and 
+        _scan_right().
+    """
+    start   = int(start)
+    bits    = int.from_bytes(
+        np.packbits(peak, bitorder='little').tobytes(), 'little')
+    outside = ~bits
+
+    # highest bin outside of the peak below start, plus one
+    peak_start_bin = (outside & ((1 << start) - 1)).bit_length()
+
+    # lowest bin outside of the peak at or above start, the padding bits 
+    # at the end of the packed array are outside of the peak
+    right          = outside >> start
+    peak_end_bin   = start + (right & -right).bit_length() - 1
+    return peak_start_bin, peak_end_bin
+
+
+
+def _scan_left(peak, start):
+    """Finds the first bin of the run of peak bins that ends at start
+
+    Args:
+        peak: boolean array, true for the bins that are part of a peak.
+        start: bin to scan left from, the bin itself is not checked.
+
+    Returns:
+        Index of the first peak bin, zero when the peak reaches the first bin.
+    """
+    i = start - 1
+    while (i >= 0) and peak[i]:
+        i -= 1
+    return i + 1
+
+
+def _scan_right(peak, start):
+    """Finds the first bin after the run of peak bins that starts at start
+
+    Args:
+        peak: boolean array, true for the bins that are part of a peak.
+        start: bin to scan right from, the bin itself is checked.
+
+    Returns:
+        Index of the first bin that is not part of the peak, the number of 
+        bins when the peak reaches the last bin.
+    """
+    i = start
+    while (i < len(peak)) and peak[i]:
+        i += 1
+    return i
+
+
+
+def _peak_width_kernel(intensity, max_bin_index, roll_len, conv_len):
+    """Computes the start and end bins of the dominant peak in one pass
+
+    Fused version of _peak_width_numpy(), which avoids allocating the 
+    intermediate arrays for each processing step. 
+
+    Args:
+        intensity: float array of the intensity bins of the ensemble.
+        max_bin_index: bin location of the maximum intensity value.
+        roll_len: window length of the centered rolling median.
+        conv_len: kernel length of the convolution filter.
+
+    Returns:
+        Tuple of (peak_start_bin, peak_end_bin).
+    """
+    num_bins = len(intensity)
+    if (max_bin_index == 0) or (max_bin_index >= num_bins):
+        return np.nan, np.nan
+
+    # centered rolling median, bins without a full window are zero
+    roll_pad = roll_len // 2
+    bin_roll = np.zeros(num_bins)
+    window   = np.empty(roll_len)
+    roll_max = 0.0
+    for i in range(num_bins - roll_len + 1):
+        # insertion sort of the window values
+        for j in range(roll_len):
+            val = intensity[i+j]
+            k   = j 
+            while (k > 0) and (window[k-1] > val):
+                window[k] = window[k-1]
+                k -= 1
+            window[k] = val
+        if roll_len % 2:
+            median = window[roll_len//2]
+        else:
+            median = (window[roll_len//2 - 1] + window[roll_len//2]) / 2
+        bin_roll[i + roll_pad] = median
+        if median > roll_max:
+            roll_max = median
+
+    # threshold the array based on half of the maximum intensity 
+    half_max  = roll_max / 2
+    threshold = np.zeros(num_bins, dtype=np.uint8)
+    for i in range(num_bins):
+        if bin_roll[i] >= half_max: 
+            threshold[i] = 1
+
+    # moving window sum of the threshold array, matches np.convolve()
+    peak = np.zeros(num_bins, dtype=np.uint8)
+    for i in range(num_bins):
+        lo = max(i - conv_len//2, 0)
+        hi = min(i + (conv_len-1)//2, num_bins - 1)
+        for j in range(lo, hi+1):
+            if threshold[j]:
+                peak[i] = 1
+                break
+
+    # scan outwards from the maximum for the first bins outside the peak
+    peak_start_bin = _scan_left(peak, max_bin_index)
+    peak_end_bin   = _scan_right(peak, max_bin_index)
+
+    return float(peak_start_bin), float(peak_end_bin)
+
+
+def _peak_width_rows(intensity_rows, max_bins, roll_len, conv_len):
+    """Computes the start and end bins of the dominant peak for each row
+
+    Args:
+        intensity_rows: 2D float array, one row of intensity bins per ensemble.
+        max_bins: int array of the maximum intensity bin of each row.
+        roll_len: window length of the centered rolling median.
+        conv_len: kernel length of the convolution filter.
+
+    Returns:
+        Tuple of (peak_start_bins, peak_end_bins) float arrays.
+    """
+    num_rows        = intensity_rows.shape[0]
+    peak_start_bins = np.empty(num_rows)
+    peak_end_bins   = np.empty(num_rows)
+    for i in _prange(num_rows):
+        peak_start_bin, peak_end_bin = _peak_width(
+            intensity_rows[i], max_bins[i], roll_len, conv_len)
+        peak_start_bins[i] = peak_start_bin
+        peak_end_bins[i]   = peak_end_bin
+    return peak_start_bins, peak_end_bins
+
+
+# select the peak width implementation depending on numba availability
+#   - the rows of a batch are processed in parallel when compiled
+#   - the ahead of time compiled kernel is used for single ensembles when 
+#     it is available, it cannot be called from other numba functions
+if numba is not None:
+    _scan_left         = numba.njit(cache=True)(_scan_left)
+    _scan_right        = numba.njit(cache=True)(_scan_right)
+    _peak_width_kernel = numba.njit(cache=True)(_peak_width_kernel)
+    _peak_width        = _peak_width_kernel
+    _prange            = numba.prange
+    _peak_width_rows   = numba.njit(cache=True, parallel=True)(_peak_width_rows)
+elif micron_kernels is not None:
+    _peak_width        = micron_kernels.peak_width
+    _prange            = range
+else:
+    _peak_width        = _peak_width_numpy
+    _prange            = range
+
+if micron_kernels is not None:
+    _peak_width_ensemble = micron_kernels.peak_width
+else:
+    _peak_width_ensemble = _peak_width
+
+
+
 class MicronEnsemble(MicronSonar):
+    # the data array is the only per-ensemble attribute that holds variables,
+    # all variables are read from it through properties 
+    #   - the cosine of bearing_ref_world is kept because both the reflection
+    #     filter and the vertical range need it
+    __slots__ = ('_data_array', '_cos_bearing')
+
+    # bin size dependent values for each (range_scale, dbytes) setting, see
+    # get_bin_shape(), a mission usually uses only a few different settings
+    _bin_shape_cache = {}
+
+    # first numerical header variable of a csv row, the numerical header 
+    # variables directly follow the line header and date time
+    _header_start    = max(MicronSonar._index.line_header, 
+                           MicronSonar._index.date_time) + 1
+
     def __init__(self, csv_row, date, bearing_bias=0, sonar_depth=None, 
         sonar_altitude=None):
         """Constructor of a Micron Sonar ensemble
@@ -41,11 +296,13 @@ class MicronEnsemble(MicronSonar):
         super().__init__()
 
         # initialize Micron Ensemble data array based on number of variables
+        #   - the array stays float64 because date_time is a POSIX timestamp,
+        #     which float32 would round to the nearest 128 seconds
         self._data_array     = np.zeros(self.ensemble_size)
 
         # parse header and acoustic intensities, compute derived variables 
-        self.set_data('sonar_depth', sonar_depth)
-        self.set_data('sonar_altitude', sonar_altitude)
+        self._data_array[self._index.sonar_depth]    = sonar_depth
+        self._data_array[self._index.sonar_altitude] = sonar_altitude
         self.parse_header(csv_row, date, bearing_bias)
         self.parse_intensity_bins(csv_row)
         self.parse_derived_vars()
@@ -60,6 +317,352 @@ class MicronEnsemble(MicronSonar):
         return self.data_array[self.intensity_index:]
 
 
+    @classmethod
+    def from_data_array(cls, data_array):
+        """Constructor of a Micron Sonar ensemble from a parsed data array
+
+        The data array is not copied, so the ensemble can be a view of one 
+        row of the data matrix returned by from_csv_rows(), or of one row of 
+        a MicronTimeSeries DataFrame.
+
+        Args:
+            data_array: 1D float array, the data array of an ensemble.
+
+        Returns:
+            Micron Sonar ensemble object.
+        """
+        ensemble = cls.__new__(cls)
+        if len(data_array) != ensemble.ensemble_size:
+            raise ValueError("bad data array for: from_data_array(%d)" % 
+                             (len(data_array)))
+        ensemble._data_array  = data_array
+        ensemble._cos_bearing = math.cos(
+            data_array[cls._index.bearing_ref_world] * cls.DEG_TO_RAD)
+        return ensemble
+
+
+    @classmethod
+    def from_csv_rows(cls, csv_rows, date, bearing_bias=0, sonar_depth=None, 
+        sonar_altitude=None):
+        """Parses many Micron Sonar ensembles at once into one data matrix
+
+        Batch version of the MicronEnsemble constructor: the header, intensity,
+        and derived variables are computed for all of the rows at once with 
+        vectorized operations, instead of once per ensemble. Each row of the 
+        data matrix is identical to the data array of a MicronEnsemble 
+        constructed from the same csv row. Use from_data_array() to view a 
+        row of the data matrix as an ensemble.
+
+        Args:
+            csv_rows: a list of csv rows, each a list of strings representing
+                one ensemble (see the MicronEnsemble constructor).
+            date: tuple of integers (year,month,day) (ex: 2020,01,24)
+            bearing_bias: bias in the sonar head (positive means rolling right)
+            sonar_depth: depth in [m] of the sonar transducer head.
+            sonar_altitude: altitude in [m] of the sonar transducer head.
+
+        Returns:
+            Tuple of (data_matrix, data_lookup), where data_lookup maps each 
+            variable to its column in the data matrix.
+        """
+        # split the csv rows into the time of day, the numerical header 
+        # variables, and the raw intensity bins, see parse_header() and 
+        # parse_intensity_bins()
+        #   - rows have different numbers of bins, so are copied one at a time
+        num_rows      = len(csv_rows)
+        date_index    = cls._index.date_time
+        num_start     = cls._header_start
+        num_end       = cls._header_len
+        time_strings  = [row[date_index] for row in csv_rows]
+        header_fields = np.asarray(
+            [row[num_start:num_end] for row in csv_rows], 
+            dtype=np.float64).reshape(num_rows, num_end - num_start)
+        dbytes        = header_fields[:, cls._index.dbytes - num_start]
+        raw_bins      = np.zeros((num_rows, cls._intensity_len), 
+                                 dtype=np.uint8)
+        for i, row in enumerate(csv_rows):
+            num_bins = min(max(int(dbytes[i]) - 1, 0), cls._intensity_len)
+            raw_bins[i, :num_bins] = np.asarray(
+                row[num_end : num_end + num_bins], dtype=np.uint8)
+
+        return cls._from_fields(time_strings, header_fields, raw_bins, date,
+                                bearing_bias, sonar_depth, sonar_altitude)
+
+
+    @classmethod
+    def _from_fields(cls, time_strings, header_fields, raw_bins, date, 
+        bearing_bias, sonar_depth, sonar_altitude):
+        """Computes the data matrix from the fields of the csv rows
+
+        See from_csv_rows(), which splits the csv rows into these fields, and
+        _read_fields(), which reads them directly from a csv file.
+
+        Args:
+            time_strings: list of the date_time header variable of each row.
+            header_fields: 2D float array of the numerical header variables 
+                of each row, the ones after line_header and date_time.
+            raw_bins: (num_rows, intensity_len) uint8 array of the reported 
+                intensity bins of each row, in [0,255]. Only the first 
+                dbytes-1 bins of a row are used.
+            date: tuple of integers (year,month,day) (ex: 2020,01,24)
+            bearing_bias: bias in the sonar head (positive means rolling right)
+            sonar_depth: depth in [m] of the sonar transducer head.
+            sonar_altitude: altitude in [m] of the sonar transducer head.
+
+        Returns:
+            Tuple of (data_matrix, data_lookup), see from_csv_rows().
+        """
+        # use a Micron Sonar object for the constants and label tables
+        #   - the data matrix is column-major, so each variable is one 
+        #     contiguous array and pandas can use the matrix without a copy
+        sonar     = MicronSonar()
+        lookup    = sonar.data_lookup
+        num_rows  = len(time_strings)
+        data      = np.zeros((num_rows, sonar.ensemble_size), order='F')
+        bins      = data[:, sonar.intensity_index:]
+        bin_index = np.arange(sonar.intensity_len)
+
+        def column(var):
+            """Inner function for a view of one variable of the data matrix"""
+            return data[:, lookup[var]]
+
+        # parse header variables, see parse_header()
+        (year, month, day) = date
+        column('line_header')[:] = 1
+        column('date_time')[:]   = [
+            sonar.get_timestamp(time, date) for time in time_strings]
+        column('year')[:]  = year
+        column('month')[:] = month
+        column('day')[:]   = day
+        data[:, cls._header_start:sonar.header_len] = header_fields
+        column('sonar_depth')[:]    = sonar_depth
+        column('sonar_altitude')[:] = sonar_altitude
+        column('bearing_bias')[:]   = bearing_bias
+
+        # convert header values to standard metric values 
+        data[:, :sonar.header_len] *= sonar.HEADER_SCALE
+
+        # update coordinate system of Micron Sonar bearing, see 
+        # reorient_bearing() for more information
+        for var in ('bearing', 'left_lim', 'right_lim'):
+            bearing = column(var)
+            bearing *= -1
+            bearing[bearing <= -180] += 360
+        ref_world = column('bearing_ref_world')
+        ref_world[:] = column('bearing') + bearing_bias
+        column('incidence_angle')[:] = np.abs(ref_world)
+        bin_size = column('bin_size')
+        bin_size[:] = column('range_scale') / column('dbytes')
+
+        # check the intensity bins, see parse_intensity_bins()
+        #   - the sonar reports each bin in [0,255], so the raw bins are kept
+        #     as uint8 until they are converted to [dB], which is an eighth 
+        #     of the memory traffic for the filtering and the maximum
+        dbytes = column('dbytes')
+        if np.any(dbytes > sonar.intensity_len):
+            raise ValueError("bad number of bins: %d" % 
+                             (dbytes[dbytes > sonar.intensity_len][0]))
+
+        # filter out blanking distance and surface/bottom reflections, see 
+        # filter_blanking_distance() and filter_reflections()
+        #   - only the bins between the two cutoff bins of a row are kept
+        #   - the final reported bin and any extra bins are set to zero
+        blanking_bin   = cls._blanking_cutoff(bin_size)
+        reflection_bin = np.minimum(cls._reflection_cutoff(
+            ref_world, sonar_depth, sonar_altitude, bin_size), dbytes - 1)
+        raw_bins *= ((bin_index >= blanking_bin[:, None]) & 
+                     (bin_index <  reflection_bin[:, None]))
+
+        # compute derived variables, see parse_derived_vars()
+        #   - the [dB] conversion is increasing, so the maximum bin is the 
+        #     same for the raw bins
+        #   - the peak width is computed over a row-major copy of the bins, 
+        #     so that the bins of each ensemble are contiguous
+        max_intensity_bin = np.argmax(raw_bins, axis=1)
+        db_bins           = raw_bins * sonar.BIN_TO_DB
+        bins[:]           = db_bins
+        column('max_intensity')[:]     = db_bins[np.arange(num_rows), 
+                                                 max_intensity_bin]
+        column('max_intensity_bin')[:] = max_intensity_bin
+        peak_start_bin, peak_end_bin   = _peak_width_rows(
+            db_bins, max_intensity_bin, sonar.ROLL_MEDIAN_LEN, 
+            sonar.CONV_KERNEL_LEN)
+        peak_width_bin = peak_end_bin - peak_start_bin
+        peak_start     = peak_start_bin * bin_size
+        column('peak_start_bin')[:]     = peak_start_bin
+        column('peak_end_bin')[:]       = peak_end_bin
+        column('peak_width_bin')[:]     = peak_width_bin
+        column('peak_start')[:]         = peak_start
+        column('peak_end')[:]           = peak_end_bin   * bin_size
+        column('peak_width')[:]         = peak_width_bin * bin_size
+        column('max_intensity_norm')[:] = column('max_intensity') * peak_start
+
+        # compute vertical range, see get_vertical_range()
+        cos_bearing = np.cos(ref_world * sonar.DEG_TO_RAD)
+        column('vertical_range')[:] = np.where(cos_bearing < 0, np.nan, 
+                                               peak_start*cos_bearing)
+
+        # set ice classifications and labels to np.nan
+        for ice_var in sonar.ice_vars:
+            column(ice_var)[:] = np.nan
+
+        return data, lookup
+
+
+    @classmethod
+    def _blanking_cutoff(cls, bin_size):
+        """Computes the first bin outside of the blanking distance
+
+        Vectorized version of the cutoff used by filter_blanking_distance().
+
+        Args:
+            bin_size: float array of the bin size of each ensemble.
+
+        Returns:
+            int array of the blanking cutoff bin of each ensemble.
+        """
+        with np.errstate(divide='ignore'):
+            cutoff = np.ceil(cls.BLANKING_DISTANCE / bin_size)
+        return np.clip(cutoff, 0, cls._intensity_len).astype(np.int64)
+
+
+    @classmethod
+    def _reflection_cutoff(cls, ref_world, sonar_depth, sonar_altitude, 
+        bin_size):
+        """Computes the first bin of the surface or bottom reflections
+
+        Vectorized version of the cutoff used by filter_reflections(). The 
+        cutoff of an ensemble without an expected reflection is the number 
+        of intensity bins.
+
+        Args:
+            ref_world: float array of the bearing_ref_world of each ensemble.
+            sonar_depth: depth in [m] of the sonar transducer head, a scalar 
+                or an array, None or np.nan when unknown.
+            sonar_altitude: altitude in [m] of the sonar transducer head, a 
+                scalar or an array, None or np.nan when unknown.
+            bin_size: float array of the bin size of each ensemble.
+
+        Returns:
+            int array of the reflection cutoff bin of each ensemble.
+        """
+        cos_bear = np.abs(np.cos(ref_world * cls.DEG_TO_RAD))
+        cutoff   = np.full(np.shape(ref_world), float(cls._intensity_len))
+        for (dist, facing) in ((sonar_depth,    np.abs(ref_world) < 90), 
+                               (sonar_altitude, np.abs(ref_world) > 90)):
+            dist = np.asarray(dist, dtype=np.float64)
+            mask = (facing & (cos_bear >= cls.COS_EPSILON) & 
+                    (dist != 0) & (~np.isnan(dist)))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                dist_bin = np.floor(
+                    dist*cls.REFLECTION_FACTOR/cos_bear / bin_size)
+            cutoff = np.where(mask, np.minimum(cutoff, dist_bin), cutoff)
+        return np.clip(cutoff, 0, cls._intensity_len).astype(np.int64)
+
+
+    @classmethod
+    def from_csv(cls, filepath, date, bearing_bias=0, sonar_depth=None, 
+        sonar_altitude=None):
+        """Parses every ensemble of a raw Micron Sonar csv file at once
+
+        The whole file is parsed with from_csv_rows(), so no MicronEnsemble 
+        object is created for the rows. pandas is only imported by this 
+        function, parsing single ensembles does not require it.
+
+        Args:
+            filepath: the file path to the Micron Sonar csv file to read.
+            date: tuple of integers (year,month,day) (ex: 2020,01,24)
+            bearing_bias: bias in the sonar head (positive means rolling right)
+            sonar_depth: depth in [m] of the sonar transducer head.
+            sonar_altitude: altitude in [m] of the sonar transducer head.
+
+        Returns:
+            pandas DataFrame with one row per ensemble, indexed by date_time,
+            with the same columns as a MicronTimeSeries DataFrame.
+        """
+        import pandas as pd
+
+        # read the fields of all csv rows at once, or with csv.reader when 
+        # the file cannot be read in bulk, ignoring the header and any empty
+        # rows, then parse the ensembles into the data matrix
+        fields = cls._read_fields(filepath)
+        if fields is not None:
+            (data, _) = cls._from_fields(*fields, date, bearing_bias, 
+                                         sonar_depth, sonar_altitude)
+        else:
+            with open(filepath, newline='') as csv_file:
+                reader   = csv.reader(csv_file)
+                next(reader, None)
+                csv_rows = [row for row in reader if len(row) > 1]
+            (data, _) = cls.from_csv_rows(
+                csv_rows, date, bearing_bias, sonar_depth=sonar_depth,
+                sonar_altitude=sonar_altitude)
+
+        # convert the data matrix into a DataFrame
+        index = MicronSonar().get_datetime_index(data[:, cls._index.date_time])
+        return pd.DataFrame(data=data, index=index, columns=cls._label_list,
+                            copy=False)
+
+
+    @classmethod
+    def _read_fields(cls, filepath):
+        """Reads the fields of every row of a raw Micron Sonar csv file
+
+        Bulk version of splitting the rows read by csv.reader: each line is 
+        only split up to the intensity bins, and the bins of all of the 
+        lines are joined and converted by a single np.fromstring() call.
+
+        Args:
+            filepath: the file path to the Micron Sonar csv file to read.
+
+        Returns:
+            Tuple of (time_strings, header_fields, raw_bins), see 
+            _from_fields(), or None when the file has values that are not 
+            plain integers, such as quoted or missing values, and must be 
+            read with csv.reader instead.
+        """
+        num_start = cls._header_start
+        num_end   = cls._header_len
+        with open(filepath, 'rb') as csv_file:
+            lines = csv_file.read().splitlines()[1:]
+        rows      = [line.split(b',', num_end) for line in lines]
+        rows      = [row for row in rows if len(row) > 1]
+        num_rows  = len(rows)
+
+        # split each row into its header variables and its intensity bins
+        #   - the bins of a row are one string, all joined by commas
+        bin_fields = [row[num_end] if len(row) > num_end else b'' 
+                      for row in rows]
+        num_fields = np.array([field.count(b',') + 1 if field else 0 
+                               for field in bin_fields], dtype=np.int64)
+        try:
+            time_strings  = [row[cls._index.date_time].decode() 
+                             for row in rows]
+            header_fields = np.asarray(
+                [row[num_start:num_end] for row in rows], 
+                dtype=np.float64).reshape(num_rows, num_end - num_start)
+            flat_bins     = np.fromstring(
+                b','.join([field for field in bin_fields if field]), 
+                dtype=np.int64, sep=',')
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+        # every row must have valid bins up to the final reported bin, as 
+        # from_csv_rows() requires
+        dbytes   = header_fields[:, cls._index.dbytes - num_start]
+        num_bins = np.clip(dbytes - 1, 0, cls._intensity_len)
+        if (len(flat_bins) != num_fields.sum()) or \
+           np.any(num_fields < num_bins) or \
+           np.any((flat_bins < 0) | (flat_bins > 255)):
+            return None
+
+        # scatter the bins into the rows of the raw bin matrix
+        width    = max(num_fields.max(initial=0), cls._intensity_len)
+        raw_bins = np.zeros((num_rows, width), dtype=np.uint8)
+        raw_bins[np.arange(width) < num_fields[:, None]] = flat_bins
+        return time_strings, header_fields, raw_bins[:, :cls._intensity_len]
+
+
     def get_data(self, var):
         """Getter method for a give variable in the data array"""
         if (var not in self.label_set):
@@ -68,12 +671,11 @@ class MicronEnsemble(MicronSonar):
             return self.data_array[self.data_lookup[var]]
 
 
-    def set_data(self, var, val, attribute=True):
+    def set_data(self, var, val):
         """Setter method for a variable-value pair to be put in the array"""
         if (var not in self.label_set):
             raise ValueError("bad variable for: set(%s, %s)" % (var, str(val)))
         self._data_array[self.data_lookup[var]] = val 
-        if attribute: setattr(self, var, val)
 
 
     def parse_header(self, csv_row, date, bearing_bias):
@@ -86,81 +688,79 @@ class MicronEnsemble(MicronSonar):
                 when the data was collected. Positive bearing bias corresponds 
                 with the vehicle rolling right due to a banked right turn. 
         """
+        (data, idx)        = (self._data_array, self._index)
+        (year, month, day) = date
+
         # add header values to the data array 
-        for i in range(len(self.header_vars)):
-
-            # handle line header parameter (does not contain numerical type)
-            if (i == self.header_vars.index('line_header')): 
-                self.set_data('line_header', 1)
-            
-            # add year,month,day to DateTime object  
-            elif (i == self.header_vars.index('date_time')): 
-                (year, month, day) = date
-                date_time = date_time = dateutil.parser.parse(csv_row[i])
-                date_time = date_time.replace(year=year, month=month, day=day,
-                                              microsecond=0)
-                self.set_data('date_time', date_time.timestamp())
-                self.set_data('year',  year)
-                self.set_data('month', month)
-                self.set_data('day',   day)
-
-            # parse all other header variables (all others are numerical) 
-            else:
-                variable = self.header_vars[i]
-                value = int(csv_row[i])
-                self.set_data(variable, value)
+        #   - header variables occupy the same positions in the csv row and 
+        #     in the data array
+        line_index = idx.line_header
+        date_index = idx.date_time
+
+        # handle line header parameter (does not contain numerical type)
+        data[idx.line_header] = 1
+
+        # add year,month,day to the time of day of the ensemble
+        data[idx.date_time] = self.get_timestamp(csv_row[date_index], date)
+        data[idx.year]  = year
+        data[idx.month] = month
+        data[idx.day]   = day
+
+        # parse all other header variables in a single pass (all others are
+        # numerical and directly follow the line header and date time)
+        num_start = max(line_index, date_index) + 1
+        num_end   = self.header_len
+        data[num_start:num_end] = np.asarray(
+            csv_row[num_start:num_end], dtype=np.float64)
 
         # set the bearing bias to compute the bearing correctly 
-        self.set_data('bearing_bias', bearing_bias)
+        data[idx.bearing_bias] = bearing_bias
 
         # convert header values to standard metric values 
-        self.convert_to_metric('range_scale', self.DM_TO_M)
-        self.convert_to_metric('gain',        self.BIN_TO_PER)
-        self.convert_to_metric('ad_low',      self.BIN_TO_DB)
-        self.convert_to_metric('ad_span',     self.BIN_TO_DB)
-        self.convert_to_metric('left_lim',    self.GRAD_TO_DEG)
-        self.convert_to_metric('right_lim',   self.GRAD_TO_DEG)
-        self.convert_to_metric('steps',       self.GRAD_TO_DEG*2)
-        self.convert_to_metric('bearing',     self.GRAD_TO_DEG)
+        data[:self.header_len] *= self.HEADER_SCALE
 
         # update coordinate system of Micron Sonar bearing 
-        #   - includes bearing bias correction 
-        bearing   = self.reorient_bearing(self.get_data('bearing'), bias=False)
-        ref_world = self.reorient_bearing(self.get_data('bearing'), bias=True)
-        left_lim  = self.reorient_bearing(self.get_data('left_lim'))
-        right_lim = self.reorient_bearing(self.get_data('right_lim'))
-        self.set_data('bearing',            bearing)
-        self.set_data('bearing_ref_world',  ref_world)
-        self.set_data('left_lim',           left_lim)
-        self.set_data('right_lim',          right_lim)
+        #   - includes bearing bias correction, which is added to the 
+        #     reoriented bearing instead of reorienting the bearing twice
+        bearing   = self.reorient_bearing(data[idx.bearing], bias=False)
+        ref_world = bearing + bearing_bias
+        left_lim  = self.reorient_bearing(data[idx.left_lim])
+        right_lim = self.reorient_bearing(data[idx.right_lim])
+        data[idx.bearing]            = bearing
+        data[idx.bearing_ref_world]  = ref_world
+        data[idx.left_lim]           = left_lim
+        data[idx.right_lim]          = right_lim
 
         # compute incidence angle based upon bearing after corrected 
         #   - incidence angle is defined as the angle deviation away from 
         #     the sonar pointing directly upwards to the ocean (or ice) surface
-        incidence_angle = abs(self.get_data('bearing_ref_world'))
-        self.set_data('incidence_angle', incidence_angle)
+        incidence_angle = abs(ref_world)
+        data[idx.incidence_angle] = incidence_angle
+
+        # cosine of the bearing, used by filter_reflections() and 
+        # get_vertical_range()
+        self._cos_bearing = math.cos(ref_world * self.DEG_TO_RAD)
 
         # compute the bin size in order to parse intensity bins correctly
-        self.set_data('bin_size', self.range_scale / self.dbytes)
+        (bin_size, _) = self.get_bin_shape()
+        data[idx.bin_size] = bin_size
 
 
     def parse_intensity_bins(self, csv_row):
         """Parses acoustic intensity values and adds them to the data array"""
         # more intensity bins are received than the size of the array
-        if self.dbytes > self.intensity_len:
-            raise ValueError("bad number of bins: %d" % (self.dbytes))
-
-        # add intensity values to the data array 
-        for i in range(self.intensity_len):
-            bin_label = 'bin_' + str(i)
-            # parse the intensity value directly from the array 
-            if (i+1) < self.dbytes: 
-                bin_val   = float(csv_row[i+self.header_len])
-            # keep extra bins set to zero  
-            else:
-                break
-            self.set_data(bin_label, bin_val, attribute=False)
-        
+        dbytes = self._data_array[self._index.dbytes]
+        if dbytes > self.intensity_len:
+            raise ValueError("bad number of bins: %d" % (dbytes))
+
+        # add intensity values to the data array in a single slice assignment
+        #   - the final reported bin and any extra bins are kept set to zero
+        num_bins  = max(int(dbytes) - 1, 0)
+        bin_start = self.intensity_index
+        csv_start = self.header_len
+        self._data_array[bin_start : bin_start + num_bins] = np.asarray(
+            csv_row[csv_start : csv_start + num_bins], dtype=np.float64)
+
         # convert intensity bins from [0,255] -> [0,80dB]
         self.convert_to_metric('intensity', self.BIN_TO_DB, intensity=True)
 
@@ -171,23 +771,29 @@ class MicronEnsemble(MicronSonar):
 
     def parse_derived_vars(self):
         """Computes the derived quantities for the ensemble"""
-        # compute bin size, max intensity, and max intensity bin
-        self.set_data('max_intensity',     np.max(self.intensity_data))
-        self.set_data('max_intensity_bin', np.argmax(self.intensity_data))
+        (data, idx) = (self._data_array, self._index)
+
+        # compute max intensity and max intensity bin 
+        #   - the maximum is read at the argmax, one pass over the bins
+        intensity         = self.intensity_data
+        max_intensity_bin = int(np.argmax(intensity))
+        data[idx.max_intensity]     = intensity[max_intensity_bin]
+        data[idx.max_intensity_bin] = max_intensity_bin
 
         # determine the peak of the signal according to the FWHM method
         peak_start_bin, peak_end_bin = self.get_peak_width()
         peak_width_bin = peak_end_bin - peak_start_bin
-        self.set_data('peak_start_bin',  peak_start_bin)
-        self.set_data('peak_end_bin',    peak_end_bin)
-        self.set_data('peak_width_bin',  peak_width_bin)
-        self.set_data('peak_start',      peak_start_bin * self.bin_size)
-        self.set_data('peak_end',        peak_end_bin   * self.bin_size)
-        self.set_data('peak_width',      peak_width_bin * self.bin_size)
+        bin_size       = data[idx.bin_size]
+        data[idx.peak_start_bin]  = peak_start_bin
+        data[idx.peak_end_bin]    = peak_end_bin
+        data[idx.peak_width_bin]  = peak_width_bin
+        data[idx.peak_start]      = peak_start_bin * bin_size
+        data[idx.peak_end]        = peak_end_bin   * bin_size
+        data[idx.peak_width]      = peak_width_bin * bin_size
 
         # compute the normalized max intensity using peak_start variable
-        max_intensity_norm = self.max_intensity * self.peak_start
-        self.set_data('max_intensity_norm', max_intensity_norm)
+        max_intensity_norm = data[idx.max_intensity] * data[idx.peak_start]
+        data[idx.max_intensity_norm] = max_intensity_norm
 
         # compute vertical range from slant range and bearing 
         self.get_vertical_range()
@@ -195,16 +801,14 @@ class MicronEnsemble(MicronSonar):
         # set ice classifications and labels to np.nan
         #   + classifications are made based on swaths not single ensembles
         #   + labels are specified manually 
-        for ice_var in self.ice_vars:
-            self.set_data(ice_var, np.nan)
+        data[self.intensity_index - self.ice_len : self.intensity_index] = \
+            np.nan
 
 
-    def convert_to_metric(self, variable, multiplier, attribute=True, 
-        intensity=False):
+    def convert_to_metric(self, variable, multiplier, intensity=False):
         """Converts variable to standard metric value using the multiplier"""
         if not intensity:
-            value = self.get_data(variable)
-            self.set_data(variable, value * multiplier, attribute)
+            self._data_array[self.data_lookup[variable]] *= multiplier
         else:
             self._data_array[self.intensity_index:] *= multiplier
 
@@ -232,38 +836,62 @@ class MicronEnsemble(MicronSonar):
 
         # if given, include bearing bias term (possible due to vehicle roll)
         if bias: 
-            bearing_deg += self.get_data('bearing_bias')
+            bearing_deg += self._data_array[self._index.bearing_bias]
         return bearing_deg
 
 
+    def get_bin_shape(self):
+        """Looks up the values that only depend on the size of the bins
+
+        The bin size only depends on the range_scale and dbytes settings, 
+        which rarely change during a mission, so the values are computed once
+        for each setting and cached.
+
+        Returns:
+            Tuple of (bin_size, blanking_dist_bin).
+        """
+        (data, idx) = (self._data_array, self._index)
+        key = (data[idx.range_scale], data[idx.dbytes])
+        if key not in MicronEnsemble._bin_shape_cache:
+            bin_size          = key[0] / key[1]
+            blanking_dist_bin = math.ceil(self.BLANKING_DISTANCE/bin_size)
+            MicronEnsemble._bin_shape_cache[key] = \
+                (bin_size, blanking_dist_bin)
+        return MicronEnsemble._bin_shape_cache[key]
+
+
     def filter_blanking_distance(self):
         """Filters out the intensity values within blanking distance"""
-        blanking_dist_bin = math.ceil(self.BLANKING_DISTANCE/self.bin_size)
+        (_, blanking_dist_bin) = self.get_bin_shape()
         self._data_array[self.intensity_index : 
                          self.intensity_index + blanking_dist_bin] = 0
 
 
     def filter_reflections(self):
         """Filters out surface and bottom reflections"""
+        (data, idx) = (self._data_array, self._index)
+        bearing_ref_world = data[idx.bearing_ref_world]
+        sonar_depth       = data[idx.sonar_depth]
+        sonar_altitude    = data[idx.sonar_altitude]
+
         # epsilon defined to detect when cosine is sufficiently close to zero
-        cos_bear = abs(np.cos(self.bearing_ref_world * self.DEG_TO_RAD))
-
-        def filter_at_dist(dist):
-            """Inner function for filtering array values"""
-            bin_index = np.max(math.floor(dist/self.bin_size))
-            self._data_array[self.intensity_index + bin_index:] = 0
-
-        # filter-out surface reflections when depth is known
-        if ((self.sonar_depth) and 
-            (abs(self.bearing_ref_world) < 90) and
-            (cos_bear >= self.COS_EPSILON)):
-            filter_at_dist(self.sonar_depth*self.REFLECTION_FACTOR/cos_bear)
-        
-        # filter-out bottom reflections when depth is known
-        if ((self.sonar_altitude) and 
-            (abs(self.bearing_ref_world) > 90) and
-            (cos_bear >= self.COS_EPSILON)):
-            filter_at_dist(self.sonar_altitude*self.REFLECTION_FACTOR/cos_bear)
+        #   - the distance is floored to bins as in _reflection_cutoff()
+        cos_bear     = abs(self._cos_bearing)
+        (bin_size, _) = self.get_bin_shape()
+        is_valid_cos = cos_bear >= self.COS_EPSILON
+
+        # filter-out surface reflections when depth is known and bottom 
+        # reflections when altitude is known, from the closest cutoff bin
+        #   - unknown depth or altitude is stored as np.nan in the data array
+        #   - the cutoff bin is clipped to the number of intensity bins
+        cutoff_bin = self.intensity_len
+        for (dist, facing) in ((sonar_depth,    abs(bearing_ref_world) < 90),
+                               (sonar_altitude, abs(bearing_ref_world) > 90)):
+            if (dist) and (not math.isnan(dist)) and facing and is_valid_cos:
+                dist_bin   = math.floor(
+                    dist*self.REFLECTION_FACTOR/cos_bear / bin_size)
+                cutoff_bin = min(cutoff_bin, max(dist_bin, 0))
+        self._data_array[self.intensity_index + cutoff_bin:] = 0
 
 
     def get_peak_width(self):
@@ -272,49 +900,44 @@ class MicronEnsemble(MicronSonar):
         Uses the Full Width Half Maximum (FWHM) method for extracting the width
         of the main signal peak. To account for narrow peaks in ensemble 
         intensity values, a rolling median filter and convolution filter 
-        methods are applied. 
+        methods are applied. When numba is installed, the computation is done
+        by the compiled _peak_width_kernel() instead of _peak_width_numpy(),
+        or by its ahead of time compiled version from build_kernels.py.
+
+        Returns:
+            Tuple of (peak_start_bin, peak_end_bin).
         """
-        # get width of values that satisfy the threshold 
-        bin_data = pd.DataFrame(self.intensity_data)
-        bin_roll = bin_data.rolling(self.ROLL_MEDIAN_LEN, center=True).median()
-        bin_roll = bin_roll.replace(np.nan, 0).to_numpy().flatten()
-        kernel   = np.ones(self.CONV_KERNEL_LEN, dtype=int)
-        
-        # threshold the array based on half of the maximum intensity 
-        bin_threshold = np.array(bin_roll)
-        bin_threshold[bin_threshold <  np.max(bin_roll) / 2] = 0
-        bin_threshold[bin_threshold >= np.max(bin_roll) / 2] = 1
-        
-        # convolve the threshold array to account for narrow valleys 
-        bin_threshold = np.convolve(bin_threshold, kernel, mode='same')
-        bin_threshold[bin_threshold > 0] = 1
-        
-        # separate the array into left and right sides of the maximum 
-        max_bin_index = int(self.max_intensity_bin)
-        left_of_max   = bin_threshold[             :max_bin_index]
-        right_of_max  = bin_threshold[max_bin_index:             ]
-
-        # extract the start and end peak values 
-        if (len(left_of_max) == 0) or (len(right_of_max) == 0):
-            peak_start_bin = np.nan
-            peak_end_bin   = np.nan 
-        else:
-            peak_start_bin = len(left_of_max) - np.argmax(left_of_max[::-1]==0)
-            peak_end_bin   = np.argmax(right_of_max==0) + max_bin_index
-        
-        return peak_start_bin, peak_end_bin
+        max_bin_index = int(self._data_array[self._index.max_intensity_bin])
+        return _peak_width_ensemble(self.intensity_data, max_bin_index, 
+                                    self.ROLL_MEDIAN_LEN, self.CONV_KERNEL_LEN)
 
 
     def get_vertical_range(self):
         """Computes the vertical range using slant range and bearing"""
-        cos_bearing = np.cos(self.bearing_ref_world * self.DEG_TO_RAD)
+        (data, idx) = (self._data_array, self._index)
+        cos_bearing = self._cos_bearing
 
         # compute vertical range depending on the cosine of the bearing 
         if cos_bearing < 0:
             vertical_range = np.nan
         else:
-            vertical_range = self.peak_start*cos_bearing
+            vertical_range = data[idx.peak_start]*cos_bearing
 
         # set the vertical range value 
-        self.set_data('vertical_range', vertical_range)
+        data[idx.vertical_range] = vertical_range
+
+
+
+def _add_data_properties(cls):
+    """Adds a read-only property for each non-intensity variable of the class
+
+    The header, derived, and ice variables of an ensemble are accessed as 
+    attributes, such as ensemble.bearing, which read directly from the data 
+    array so that the attributes can never disagree with the data array.
+    """
+    for var in cls._label_list[:cls._intensity_index]:
+        index = cls._data_lookup[var]
+        setattr(cls, var, property(lambda self, i=index: self._data_array[i]))
+
 
+_add_data_properties(MicronEnsemble)
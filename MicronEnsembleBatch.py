@@ -0,0 +1,101 @@
+# MicronEnsembleBatch.py
+#
+# Represents a batch of Micron Sonar ensembles stored in one data matrix.
+
+import numpy as np
+from MicronSonar import MicronSonar
+from MicronEnsemble import MicronEnsemble
+
+
+class MicronEnsembleBatch(MicronSonar):
+    # attributes of each object, see MicronSonar
+    __slots__ = ('_data_matrix',)
+
+    def __init__(self, csv_rows, date, bearing_bias=0, sonar_depth=None,
+        sonar_altitude=None):
+        """Constructor of a batch of Micron Sonar ensembles
+
+        The ensembles are parsed together with MicronEnsemble.from_csv_rows()
+        and stored as the rows of one (num_rows, ensemble_size) data matrix.
+        Each variable of the batch is a column view of the data matrix, so
+        operations over a variable, such as batch.max_intensity.mean(), are
+        done over contiguous NumPy arrays instead of over many ensembles.
+
+        Args:
+            csv_rows: a list of csv rows, each a list of strings representing
+                one ensemble (see the MicronEnsemble constructor).
+            date: tuple of integers (year,month,day) (ex: 2020,01,24)
+            bearing_bias: bias in the sonar head (positive means rolling right)
+            sonar_depth: depth in [m] of the sonar transducer head.
+            sonar_altitude: altitude in [m] of the sonar transducer head.
+        """
+        # use the parent constructor for defining Micron Sonar variables
+        super().__init__()
+
+        # parse all of the ensembles into the data matrix at once
+        self._data_matrix, _ = MicronEnsemble.from_csv_rows(
+            csv_rows, date, bearing_bias, sonar_depth=sonar_depth,
+            sonar_altitude=sonar_altitude)
+
+
+    @property
+    def data_matrix(self):
+        return self._data_matrix
+
+    @property
+    def intensity_data(self):
+        return self.data_matrix[:, self.intensity_index:]
+
+
+    @classmethod
+    def from_data_matrix(cls, data_matrix):
+        """Constructor of a batch of Micron Sonar ensembles from a data matrix
+
+        The data matrix is not copied, so the batch can be a view of the
+        values of a MicronTimeSeries DataFrame.
+
+        Args:
+            data_matrix: 2D float array, one ensemble data array per row.
+
+        Returns:
+            Micron Sonar ensemble batch object.
+        """
+        batch = cls.__new__(cls)
+        if (np.ndim(data_matrix) != 2) or \
+           (np.shape(data_matrix)[1] != batch.ensemble_size):
+            raise ValueError("bad data matrix for: from_data_matrix(%s)" %
+                             (str(np.shape(data_matrix))))
+        batch._data_matrix = data_matrix
+        return batch
+
+
+    def __len__(self):
+        return self.data_matrix.shape[0]
+
+
+    def __getitem__(self, row):
+        """Returns the ensemble at the given row, a view of the data matrix"""
+        return MicronEnsemble.from_data_array(self.data_matrix[row])
+
+
+    def get_data(self, var):
+        """Getter method for the column of a given variable in the matrix"""
+        if (var not in self.label_set):
+            raise ValueError("bad variable for: get(%s)" % (var))
+        else:
+            return self.data_matrix[:, self.data_lookup[var]]
+
+
+
+def _add_column_properties(cls):
+    """Adds a read-only property for each non-intensity variable of the class
+
+    Each property is a column view of the data matrix, one value per ensemble.
+    """
+    for var in cls._label_list[:cls._intensity_index]:
+        index = cls._data_lookup[var]
+        setattr(cls, var, property(
+            lambda self, i=index: self._data_matrix[:, i]))
+
+
+_add_column_properties(MicronEnsembleBatch)
@@ -3,171 +3,253 @@
 # Superclass for Micron Sonar Data 
 #   2020-03-25  zduguid@mit.edu         initial implementation 
 
+import collections
+import datetime
 import numpy as np
 
 class MicronSonar(object):
-    def __init__(self):
-        """Parent class for Micron Sonar data
+    """Parent class for Micron Sonar data
+
+    Used to define Micron variables that are constant between different 
+    Micron Sonar objects. The variables are class attributes, so they are 
+    defined once instead of being assigned again by every new object.
+    """
+    # no per-object attributes, so that ensembles, which are created in 
+    # large numbers, do not need a per-object __dict__
+    __slots__ = ()
+
+    # unit conversion multipliers 
+    DEG_TO_RAD  = np.pi/180    # [deg] -> [rad]
+    RAD_TO_DEG  = 180/np.pi    # [rad] -> [deg]
+    GRAD_TO_DEG = 360/6400     # [1/16 Gradians] -> [deg]
+    DM_TO_M     = 1/10         # [dm] -> [m]
+    BIN_TO_DB   = 80/255       # [0,255] -> [0,80dB]
+    BIN_TO_PER  = 1/255        # [0,255] -> [0,1] (percentage)
+
+    # other constants 
+    #   - the min_range parameter was taken from the sonar spec sheet
+    #   - the roll_median_len and conv_kernel_len parameters were tuned to
+    #     achieve the desired performance.
+    ROLL_MEDIAN_LEN   = 5      # used for taking rolling median
+    CONV_KERNEL_LEN   = 5      # used when taking convolution 
+    BLANKING_DISTANCE = 0.35   # min-range of Micron Sonar in [m]
+    REFLECTION_FACTOR = 1.5    # used for filtering out reflections 
+    COS_EPSILON       = 1e-3   # used to avoid division by zero
+
+    # time format of the date_time header variable (time of day only)
+    #   - times in any other format are parsed with dateutil instead
+    TIME_FORMAT       = '%H:%M:%S.%f'
+
+    # tuple of variables automatically reported by Micron Sonar
+    #   - DO NOT edit header_vars, sonar outputs exactly in this order
+    _header_vars = (
+        'line_header',          # line header (not important)
+        'date_time',            # date and time the line was recorded
+        'node',                 # node is 2 for imaging sonar
+        'status',               # 2 byte bitset (see readme for more info)
+        'hdctrl',               # 2 byte bitset (see readme for more info
+        'range_scale',          # range value that the sonar was operating
+        'gain',                 # gain setting used for the sonar 
+        'slope',                # receiver slope, Time Variable Gain (TVG)
+        'ad_low',               # used for formatting color of plots
+        'ad_span',              # used for formatting color of plots
+        'left_lim',             # left limit of swatch (left of zero) 
+        'right_lim',            # right limit of swatch (right of zero)
+        'steps',                # angular step size
+        'bearing',              # bearing relative to the transducer head 
+        'dbytes'                # the number of retrieved intensity values
+    )
+
+    # tuple of variables derived from the intensity and header values
+    #   - add variables to derived_vars as necessary
+    _derived_vars = (
+        'year',                 # year that the data was recorded
+        'month',                # month that the data was recorded
+        'day',                  # day that the data was recorded
+        'sonar_depth',          # sonar depth in [m]
+        'sonar_altitude',       # sonar altitude in [m]
+        'bearing_bias',         # bias in bearing (coming from vehicle)
+        'bearing_ref_world',    # bearing reference to the horizontal plane
+        'incidence_angle',      # incidence angle 
+        'bin_size',             # size of each bin, in [m]
+        'max_intensity',        # maximum intensity measured, in [dB]
+        'max_intensity_bin',    # bin location of the maximum value 
+        'max_intensity_norm',   # max intensity [dB] * distance [m]
+        'peak_start_bin',       # bin location of the start of the peak
+        'peak_start',           # distance from transducer to start of peak
+        'peak_end_bin',         # bin location of the end of the peak
+        'peak_end',             # distance from transducer to end of peak
+        'peak_width_bin',       # bin width of the peak
+        'peak_width',           # width of peak in terms of distance
+        'vertical_range'        # vertical range from transducer head [m]
+    )
+
+    # tuple of variables related to the classification of ice
+    #   + each variable has a classification (automated process) and
+    #     labeled (manual process)
+    #   + the goal is to use the labeled data to train a high-performance 
+    #     classification system
+    _ice_vars = (
+        'class_ice_category',   # classification result for ice-category
+        'class_ice_presence',   # classification result for ice-presence
+        'class_ice_percent',    # classification result for ice-percentage
+        'class_ice_thickness',  # classification result for ice-thickness 
+        'class_ice_slope',      # classification result for ice-slope
+        'class_ice_roughness',  # classification result for ice-roughness
+        'label_ice_category',   # user specified label  for ice-category
+        'label_ice_presence',   # user specified label  for ice-presence
+        'label_ice_percent',    # user specified label  for ice-percentage
+        'label_ice_thickness',  # user specified label  for ice-thickness 
+        'label_ice_slope',      # user specified label  for ice-slope
+        'label_ice_roughness',  # user specified label  for ice-roughness
+        'label_saltwater_flag'  # value 1 means saltwater, 0 freshwater
+    )
+
+    # multipliers that convert each header variable to a standard metric 
+    # value, header variables without a unit conversion are multiplied 
+    # by one
+    HEADER_SCALE = np.ones(len(_header_vars))
+    HEADER_SCALE[_header_vars.index('range_scale')] = DM_TO_M
+    HEADER_SCALE[_header_vars.index('gain')]        = BIN_TO_PER
+    HEADER_SCALE[_header_vars.index('ad_low')]      = BIN_TO_DB
+    HEADER_SCALE[_header_vars.index('ad_span')]     = BIN_TO_DB
+    HEADER_SCALE[_header_vars.index('left_lim')]    = GRAD_TO_DEG
+    HEADER_SCALE[_header_vars.index('right_lim')]   = GRAD_TO_DEG
+    HEADER_SCALE[_header_vars.index('steps')]       = GRAD_TO_DEG*2
+    HEADER_SCALE[_header_vars.index('bearing')]     = GRAD_TO_DEG
+
+    # ice variables that are specified manually, see 
+    # MicronTimeSeries.reset_labels()
+    _label_ice_vars  = tuple(var for var in _ice_vars 
+                             if var.startswith('label'))
+
+    # bookkeep length of each variable type 
+    _header_len      = len(_header_vars)
+    _derived_len     = len(_derived_vars)
+    _ice_len         = len(_ice_vars)
+    _intensity_len   = 500
+    _intensity_index = _header_len + _derived_len + _ice_len
+
+    # tuple of variables related to the intensity bins of the sonar
+    _intensity_vars  = tuple("bin_%s"%i for i in range(_intensity_len))
+
+    # bookkeep list of all ensemble variables
+    _label_list      = _header_vars  + \
+                       _derived_vars + \
+                       _ice_vars     + \
+                       _intensity_vars
+    _label_set       = set(_label_list)
+    _data_lookup     = {label:i for (i, label) in enumerate(_label_list)}
+    _ensemble_size   = len(_label_list)
+
+    # integer index of each non-intensity variable in the data array, used 
+    # as self._index.bearing instead of a data_lookup access by string
+    _DataIndex       = collections.namedtuple(
+        '_DataIndex', _label_list[:_intensity_index])
+    _index           = _DataIndex(*range(_intensity_index))
+
+    # POSIX timestamp of midnight for each date, see get_timestamp()
+    _day_epoch_cache = {}
+
+    # public names of the label tables and lengths, as class attributes 
+    # instead of properties so that reading them is a plain attribute lookup
+    header_vars     = _header_vars
+    derived_vars    = _derived_vars
+    ice_vars        = _ice_vars
+    intensity_vars  = _intensity_vars
+    label_list      = _label_list
+    label_set       = _label_set
+    data_lookup     = _data_lookup
+    header_len      = _header_len
+    derived_len     = _derived_len
+    ice_len         = _ice_len
+    intensity_len   = _intensity_len
+    intensity_index = _intensity_index
+    ensemble_size   = _ensemble_size
+
+
+    def parse_time(self, time_string):
+        """Parses the time of day that the ensemble was recorded
+
+        Uses datetime.strptime() with the known Micron Sonar time format, 
+        which is much faster than the generic dateutil parser. The dateutil 
+        parser is only imported and used when the time does not match 
+        TIME_FORMAT.
+
+        Args:
+            time_string: the date_time header variable of the ensemble.
+
+        Returns:
+            datetime object, the date is not meaningful and should be replaced.
+        """
+        try:
+            return datetime.datetime.strptime(time_string.strip(), 
+                                              self.TIME_FORMAT)
+        except ValueError:
+            import dateutil.parser
+            return dateutil.parser.parse(time_string)
+
+
+    def get_timestamp(self, time_string, date):
+        """Computes the POSIX timestamp that the ensemble was recorded
 
-        Used to define Micron variables that are constant between different 
-        Micron Sonar objects. 
+        Every ensemble of a csv file has the same date, so the timestamp of 
+        midnight is computed once per date and the time of day is added to 
+        it. Days with a daylight saving time change are not cached, and the 
+        timestamp is computed from the full date and time instead.
+
+        Args:
+            time_string: the date_time header variable of the ensemble.
+            date: tuple of integers (year,month,day) (ex: 2020,01,24)
+
+        Returns:
+            POSIX timestamp of the ensemble, to the second.
+        """
+        (year, month, day) = date
+        time = self.parse_time(time_string)
+        if (year, month, day) not in MicronSonar._day_epoch_cache:
+            midnight  = datetime.datetime(year, month, day)
+            day_start = midnight.timestamp()
+            day_end   = (midnight + datetime.timedelta(days=1)).timestamp()
+            MicronSonar._day_epoch_cache[(year, month, day)] = \
+                day_start if (day_end - day_start == 86400) else None
+        day_epoch = MicronSonar._day_epoch_cache[(year, month, day)]
+
+        # compute the timestamp directly on days with a time change
+        if day_epoch is None:
+            return time.replace(year=year, month=month, day=day, 
+                                microsecond=0).timestamp()
+        return day_epoch + 3600*time.hour + 60*time.minute + time.second
+
+
+    def get_datetime_index(self, timestamps):
+        """Converts POSIX timestamps into a pandas DatetimeIndex
+
+        Vectorized version of datetime.fromtimestamp(), which gives the local
+        date and time of each timestamp. The local UTC offset is only looked
+        up once for every 15 minute interval that contains a timestamp, and 
+        pd.to_datetime() converts all of the shifted timestamps at once.
+
+        Args:
+            timestamps: float array of POSIX timestamps, such as date_time.
+
+        Returns:
+            pandas DatetimeIndex of the local date and time of the timestamps.
         """
-        # unit conversion multipliers 
-        self.DEG_TO_RAD  = np.pi/180    # [deg] -> [rad]
-        self.RAD_TO_DEG  = 180/np.pi    # [rad] -> [deg]
-        self.GRAD_TO_DEG = 360/6400     # [1/16 Gradians] -> [deg]
-        self.DM_TO_M     = 1/10         # [dm] -> [m]
-        self.BIN_TO_DB   = 80/255       # [0,255] -> [0,80dB]
-        self.BIN_TO_PER  = 1/255        # [0,255] -> [0,1] (percentage)
-
-        # other constants 
-        #   - the min_range parameter was taken from the sonar spec sheet
-        #   - the roll_median_len and conv_kernel_len parameters were tuned to
-        #     achieve the desired performance.
-        self.ROLL_MEDIAN_LEN   = 5      # used for taking rolling median
-        self.CONV_KERNEL_LEN   = 5      # used when taking convolution 
-        self.BLANKING_DISTANCE = 0.35   # min-range of Micron Sonar in [m]
-        self.REFLECTION_FACTOR = 1.5    # used for filtering out reflections 
-        self.COS_EPSILON       = 1e-3   # used to avoid division by zero
-
-        # tuple of variables automatically reported by Micron Sonar
-        #   - DO NOT edit header_vars, sonar outputs exactly in this order
-        self._header_vars = (
-            'line_header',          # line header (not important)
-            'date_time',            # date and time the line was recorded
-            'node',                 # node is 2 for imaging sonar
-            'status',               # 2 byte bitset (see readme for more info)
-            'hdctrl',               # 2 byte bitset (see readme for more info
-            'range_scale',          # range value that the sonar was operating
-            'gain',                 # gain setting used for the sonar 
-            'slope',                # receiver slope, Time Variable Gain (TVG)
-            'ad_low',               # used for formatting color of plots
-            'ad_span',              # used for formatting color of plots
-            'left_lim',             # left limit of swatch (left of zero) 
-            'right_lim',            # right limit of swatch (right of zero)
-            'steps',                # angular step size
-            'bearing',              # bearing relative to the transducer head 
-            'dbytes'                # the number of retrieved intensity values
-        )
-
-        # tuple of variables derived from the intensity and header values
-        #   - add variables to derived_vars as necessary
-        self._derived_vars = (
-            'year',                 # year that the data was recorded
-            'month',                # month that the data was recorded
-            'day',                  # day that the data was recorded
-            'sonar_depth',          # sonar depth in [m]
-            'sonar_altitude',       # sonar altitude in [m]
-            'bearing_bias',         # bias in bearing (coming from vehicle)
-            'bearing_ref_world',    # bearing reference to the horizontal plane
-            'incidence_angle',      # incidence angle 
-            'bin_size',             # size of each bin, in [m]
-            'max_intensity',        # maximum intensity measured, in [dB]
-            'max_intensity_bin',    # bin location of the maximum value 
-            'max_intensity_norm',   # max intensity [dB] * distance [m]
-            'peak_start_bin',       # bin location of the start of the peak
-            'peak_start',           # distance from transducer to start of peak
-            'peak_end_bin',         # bin location of the end of the peak
-            'peak_end',             # distance from transducer to end of peak
-            'peak_width_bin',       # bin width of the peak
-            'peak_width',           # width of peak in terms of distance
-            'vertical_range'        # vertical range from transducer head [m]
-        )
-
-        # tuple of variables related to the classification of ice
-        #   + each variable has a classification (automated process) and
-        #     labeled (manual process)
-        #   + the goal is to use the labeled data to train a high-performance 
-        #     classification system
-        self._ice_vars = (
-            'class_ice_category',   # classification result for ice-category
-            'class_ice_presence',   # classification result for ice-presence
-            'class_ice_percent',    # classification result for ice-percentage
-            'class_ice_thickness',  # classification result for ice-thickness 
-            'class_ice_slope',      # classification result for ice-slope
-            'class_ice_roughness',  # classification result for ice-roughness
-            'label_ice_category',   # user specified label  for ice-category
-            'label_ice_presence',   # user specified label  for ice-presence
-            'label_ice_percent',    # user specified label  for ice-percentage
-            'label_ice_thickness',  # user specified label  for ice-thickness 
-            'label_ice_slope',      # user specified label  for ice-slope
-            'label_ice_roughness',  # user specified label  for ice-roughness
-            'label_saltwater_flag'  # value 1 means saltwater, 0 freshwater
-        )
-
-        # bookkeep length of each variable type 
-        self._header_len     = len(self.header_vars)
-        self._derived_len    = len(self.derived_vars)
-        self._ice_len        = len(self.ice_vars)
-        self._intensity_len  = 500 
-        
-        # tuple of variables related to the intensity bins of the sonar
-        self._intensity_vars = tuple(["bin_%s"%i for i in \
-                                      range(self.intensity_len)])
-        # bookkeep list of all ensemble variables
-        self._label_list        = self.header_vars  + \
-                                  self.derived_vars + \
-                                  self.ice_vars     + \
-                                  self.intensity_vars 
-        self._intensity_index   = self.header_len   + \
-                                  self.derived_len  + \
-                                  self.ice_len
-        self._label_set         = set(self.label_list)
-        self._ensemble_size     = len(self.label_list)
-        self._data_lookup       = {self.label_list[i]:i \
-                                   for i in range(self.ensemble_size)}
-
-
-    @property
-    def header_vars(self):
-        return self._header_vars
-    
-    @property
-    def derived_vars(self):
-        return self._derived_vars
-    
-    @property
-    def ice_vars(self):
-        return self._ice_vars
-
-    @property
-    def intensity_vars(self):
-        return self._intensity_vars
-    
-    @property
-    def label_list(self):
-        return self._label_list
-    
-    @property
-    def label_set(self):
-        return self._label_set
-
-    @property
-    def data_lookup(self):
-        return self._data_lookup
-
-    @property
-    def header_len(self):
-        return self._header_len
-
-    @property
-    def derived_len(self):
-        return self._derived_len
-    
-    @property
-    def ice_len(self):
-        return self._ice_len
-
-    @property
-    def intensity_len(self):
-        return self._intensity_len
-
-    @property
-    def intensity_index(self):
-        return self._intensity_index
-    
-    @property
-    def ensemble_size(self):
-        return self._ensemble_size
-    
-    
\ No newline at end of file
+        import pandas as pd
+
+        # local UTC offset of each interval, in seconds
+        #   - offsets only change on daylight saving time transitions, which 
+        #     happen on a 15 minute boundary
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        (intervals, inverse) = np.unique(
+            np.floor(timestamps / 900), return_inverse=True)
+        utc     = datetime.timezone.utc
+        offsets = np.array([
+            datetime.datetime.fromtimestamp(interval*900, utc).astimezone()
+            .utcoffset().total_seconds() for interval in intervals])
+
+        # shift to the local time and round to microseconds, as datetime does
+        local_us = np.round((timestamps + offsets[inverse.ravel()]) * 1e6)
+        return pd.DatetimeIndex(pd.to_datetime(local_us.astype(np.int64), 
+                                               unit='us'))
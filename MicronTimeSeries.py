@@ -7,6 +7,8 @@ import csv
 import numpy as np
 import math
 import pandas as pd 
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from os import listdir
 from os.path import isfile, join
@@ -15,7 +17,34 @@ from MicronEnsemble import MicronEnsemble
 
 
 class MicronTimeSeries(MicronSonar):
-    def __init__(self, name=datetime.now().strftime("%Y-%m-%d %H:%M:%S")):
+    # attributes of each object, see the constructor, without a __dict__ so 
+    # that the attributes are read from fixed slots
+    __slots__    = ('_name', '_df', '_df_parts', '_buffer', '_num_ensembles',
+                    '_bearing_order', '_buffer_dir')
+
+    # number of rows of the ensemble buffer when it is first allocated
+    #   - kept small for live feeds that call to_dataframe() after a few 
+    #     ensembles, adding many ensembles at once allocates them all
+    _buffer_len  = 64
+
+    # column labels of a time series DataFrame, used to validate DataFrames
+    # without building a tuple of their columns
+    _label_index = pd.Index(MicronSonar._label_list)
+
+    # dtype of each column of a processed CSV file, see from_csv()
+    _csv_dtypes  = dict.fromkeys(MicronSonar._label_list, np.float64)
+
+    # file extension of each compression supported by save_as_csv()
+    _compression_ext = {
+        'gzip' : '.gz', 
+        'bz2'  : '.bz2', 
+        'zip'  : '.zip', 
+        'xz'   : '.xz', 
+        'zstd' : '.zst'
+    }
+
+    def __init__(self, name=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        buffer_dir=None):
         """Constructor of a Micron Sonar time series of ensembles.
 
         Please note that various Micron Sonar setting may vary from 
@@ -26,22 +55,34 @@ class MicronTimeSeries(MicronSonar):
         The time series data is stored in a pandas DataFrame object 
         for easy manipulation and access. That said, to avoid
         appending to a DataFrame (which is slow) the incoming 
-        ensembles are collected in a python list and once the 
-        to_datraframe function is called the pandas DataFrame is 
-        created.
+        ensembles are collected in a preallocated NumPy buffer and 
+        once the to_datraframe function is called the pandas 
+        DataFrame is created.
 
         Args: 
             name: The name of the time-series. For example, name could be the 
                 filename of the parsed Micron Sonar file. The name attribute 
                 is used when saving a parsed time-series to CSV format. 
+            buffer_dir: optional directory of temporary files that back the 
+                ensemble buffer, for missions that do not fit in memory. By 
+                default, the buffer is kept in memory.
         """
         # use the parent constructor for defining Micron Sonar variables
         super().__init__()
 
-        # initialize the DataFrame and ensemble list parameters 
+        # initialize the DataFrame and ensemble buffer parameters 
+        #   - the buffer is allocated when the first ensemble is added
+        #   - rows handed over by to_dataframe() are built into a DataFrame 
+        #     when the df property is next accessed, see df
         self._name          = name
         self._df            = None
-        self._ensemble_list = []
+        self._df_parts      = []
+        self._buffer        = None
+        self._num_ensembles = 0
+        self._buffer_dir    = buffer_dir
+
+        # bearing sort order of the DataFrame, see set_label_by_bearing()
+        self._bearing_order = None
 
 
     @property
@@ -50,10 +91,21 @@ class MicronTimeSeries(MicronSonar):
 
     @property
     def ensemble_list(self):
-        return self._ensemble_list
+        if self._buffer is None:
+            return np.empty((0, self.ensemble_size))
+        return self._buffer[:self._num_ensembles]
     
     @property
     def df(self):
+        # build the DataFrame of the pending ensembles only once it is used
+        #   - ensembles still in the buffer are added first, see to_dataframe()
+        #   - pending rows are combined with the existing DataFrame once, 
+        #     instead of on every append
+        if self._num_ensembles:
+            self.to_dataframe()
+        if self._df_parts:
+            self._df       = self._build_df(self._df_parts, self._df)
+            self._df_parts = []
         return self._df
 
 
@@ -72,13 +124,23 @@ class MicronTimeSeries(MicronSonar):
             Micron Sonar Time Series object.
         """
         # parse the DataFrame from the provided CSV file
+        #   - the dtype of every column is given, so that pandas does not 
+        #     infer the dtype of each column from its values
+        #   - the index is parsed as ISO 8601 date times, as written by 
+        #     save_as_csv(), instead of guessing the date format
+        #   - pandas < 2.0 does not support the ISO8601 format and guesses it
         name   = filepath.split('/')[-1].split('.')[0]
-        new_df = pd.read_csv(filepath, header=0, index_col=0, parse_dates=True)
+        new_df = pd.read_csv(filepath, header=0, index_col=0, 
+                             dtype=cls._csv_dtypes)
+        try:
+            new_df.index = pd.to_datetime(new_df.index, format='ISO8601')
+        except ValueError:
+            new_df.index = pd.to_datetime(new_df.index)
         ts     = cls(name)
         print('>> Parsing: %s' % (name))
 
         # raise error if the given CSV columns do not match 
-        if ts.label_list != tuple(new_df.columns):
+        if not new_df.columns.equals(ts._label_index):
             raise ValueError("bad csv file for: from_csv(%s)" % (name))
 
         ts._df = new_df
@@ -86,14 +148,57 @@ class MicronTimeSeries(MicronSonar):
 
 
     @classmethod
-    def from_csv_directory(cls, filepath, name=None):
+    def from_parquet(cls, filepath):
+        """Constructor of a Micron Time Series from a Parquet file
+
+        Parses Parquet files that have been saved with 
+        MicronTimeSeries.save_as_parquet(). The values and the DatetimeIndex
+        are stored in binary form, so nothing is parsed from text. Requires 
+        pyarrow or fastparquet, which pandas uses to read Parquet files.
+
+        Args: 
+            filepath: the filepath to the Parquet file to be opened.
+
+        Returns:
+            Micron Sonar Time Series object.
+        """
+        name   = filepath.split('/')[-1].split('.')[0]
+        new_df = pd.read_parquet(filepath)
+        ts     = cls(name)
+        print('>> Parsing: %s' % (name))
+
+        # raise error if the given Parquet columns do not match 
+        if not new_df.columns.equals(ts._label_index):
+            raise ValueError("bad parquet file for: from_parquet(%s)" % (name))
+
+        ts._df = new_df
+        return ts
+
+
+    @classmethod
+    def from_csv_directory(cls, filepath, name=None, max_workers=None):
         """Constructor of a Micron Time Series from a directly of CSV files
+
+        The files are independent of each other, so they are parsed in 
+        parallel by a pool of processes and combined with from_frames().
+
+        Args:
+            filepath: the directory of the csv files to be opened and parsed.
+            name: the name of the time series.
+            max_workers: the maximum number of processes, defaults to the  
+                number of processors of the machine.
         """
         print("Parsing folder of CSV files")
         # acquire a list of all files in the provided directory 
         file_list   = [f for f in listdir(filepath) if 
                        isfile(join(filepath, f)) and f.split('.')[-1] == 'csv']
-        frames      = [cls.from_csv(filepath+f).df for f in file_list]
+        file_paths  = [filepath+f for f in file_list]
+        if len(file_paths) > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                frames = list(executor.map(
+                    _read_csv_frame, [cls]*len(file_paths), file_paths))
+        else:
+            frames = [_read_csv_frame(cls, f) for f in file_paths]
         ts          =  cls.from_frames(frames, name)
         print('>> Finished Parsing!')
         return ts
@@ -108,7 +213,7 @@ class MicronTimeSeries(MicronSonar):
 
         # check to make sure all provided DataFrames have the same columns 
         for df in frames:
-            if ts.label_list != tuple(df.columns):
+            if not df.columns.equals(ts._label_index):
                 raise ValueError("bad csv file for: from_frames(%s)" % (df))
 
         # combine the DataFrames together 
@@ -136,102 +241,206 @@ class MicronTimeSeries(MicronSonar):
         Returns:
             Micron Sonar Time Series object.
         """
-        count   = 0
-        notify  = 100
         file    = filepath.split('/')[-1].split('.')[0]
         print('Parsing: %s' % (file))
 
-        # open the csv file 
-        csv_file = open(filepath)
-        header   = csv_file.readline().split(',') 
-
         # initialize a time series object 
         ts = cls(file)
 
-        # add all ensembles to the time series 
-        for line in csv_file:  
-            count   += 1
-            csv_row  = csv_file.readline().split(',')
-
-            # ignore the empty row at the end of the file 
-            if (len(csv_row) == 1):
-                break
-
-            # parse the Micron Sonar ensemble
-            ensemble = MicronEnsemble(
-                csv_row, date, bearing_bias, sonar_depth=constant_depth,
-                sonar_altitude=constant_altitude
-            )
-            
-            # add the parsed ensemble to the time series 
-            ts.add_ensemble(ensemble)
-            if (count % notify == 0):
-                print("  >> Ensembles Parsed: %5d" % (count))
-
-        # convert the list of ensembles into a DataFrame and then return
-        ts.to_dataframe()
+        # parse all ensembles of the file at once into a DataFrame 
+        #   - see MicronEnsemble.from_csv_rows() for the vectorized parsing
+        ts._df = MicronEnsemble.from_csv(
+            filepath, date, bearing_bias, sonar_depth=constant_depth, 
+            sonar_altitude=constant_altitude
+        )
+        print("  >> Ensembles Parsed: %5d" % (len(ts.df)))
         print('  >> Finished Parsing!')
         return ts
 
 
     def add_ensemble(self, ensemble):
-        """Adds a Micron Sonar ensemble to the growing list of ensembles.
+        """Adds a Micron Sonar ensemble to the growing buffer of ensembles.
 
         Args: 
             ensemble: a Micron Sonar ensemble  
         """
-        self._ensemble_list.append(ensemble.data_array)
+        self.add_ensembles((ensemble,))
+
+
+    def add_ensembles(self, ensembles):
+        """Adds a sequence of Micron Sonar ensembles to the buffer at once.
+
+        The data arrays of the ensembles are copied into the next rows of a 
+        preallocated 2D buffer, which doubles in size when it is full, so 
+        to_dataframe() does not need to copy a list of arrays into a matrix.
+        The buffer is grown at most once for all of the ensembles, and the 
+        arrays are stacked into it with one np.stack() call. The buffer is 
+        column-major, so that each variable of the DataFrame made from it is 
+        one contiguous array instead of a strided view.
+
+        Args: 
+            ensembles: a sequence of Micron Sonar ensembles, such as a list.
+        """
+        num_new = len(ensembles)
+        if not num_new:
+            return
+
+        # allocate or grow the buffer to fit all of the new ensembles 
+        num_rows = self._num_ensembles + num_new
+        if self._buffer is None:
+            self._buffer = self._allocate(max(self._buffer_len, num_rows))
+        elif num_rows > len(self._buffer):
+            buffer = self._allocate(max(2*len(self._buffer), num_rows))
+            buffer[:self._num_ensembles] = self.ensemble_list
+            self._buffer = buffer
+
+        # copy the data arrays into the new rows of the buffer
+        np.stack([ensemble.data_array for ensemble in ensembles], 
+                 out=self._buffer[self._num_ensembles:num_rows])
+        self._num_ensembles = num_rows
+
+
+    def _allocate(self, num_rows):
+        """Allocates an empty column-major matrix for num_rows ensembles
+
+        With a buffer directory, the matrix is a np.memmap of an anonymous 
+        temporary file in that directory, so the operating system can write 
+        its pages out to disk instead of keeping the whole mission in memory.
+        The file is removed once the matrix, and every DataFrame made from it,
+        is no longer used.
+
+        Args:
+            num_rows: the number of rows of the matrix.
+
+        Returns:
+            2D float array of shape (num_rows, ensemble_size).
+        """
+        shape = (num_rows, self.ensemble_size)
+        if self._buffer_dir is None:
+            return np.empty(shape, order='F')
+        with tempfile.TemporaryFile(dir=self._buffer_dir) as file:
+            return np.memmap(file, dtype=np.float64, mode='w+', shape=shape, 
+                             order='F')
 
 
     def to_dataframe(self):
         """Converts the current list of ensembles into a DataFrame.
 
-        Note: calling this function will invoke pd.concat(), which creates a 
-        copy of the whole DataFrame in memory. As a result, if this function 
-        is called many times, there will be significant slowdown. Instead,
-        consider collecting ensembles into the ensemble_list until a suitable 
-        number of ensembles have been collected, and then intermittently call 
-        the to_dataframe function.
+        Note: the DataFrame is not built right away. The rows of the buffer 
+        are kept as they are, and the DataFrame of all pending rows, with its 
+        DatetimeIndex, is built and concatenated with the existing DataFrame 
+        the next time the df property is accessed. Calling this function many 
+        times does not copy the whole DataFrame every time, and code that 
+        never accesses df does not pay for building it.
         """
-        # convert available ensembles to DataFrame
-        if self.ensemble_list:
-            ts      = np.array(self.ensemble_list)
-            cols    = self.label_list
-            t_index = self.data_lookup['date_time']
-            t       = ts[:,t_index]
-            index   = pd.DatetimeIndex([datetime.fromtimestamp(v) for v in t])
-            new_df  = pd.DataFrame(data=ts, index=index, columns=cols)
-
-            # concatenate new ensembles with existing DataFrame if possible
-            if self.df is None:
-                self._df = new_df
-            else:
-                self._df = pd.concat([self.df, new_df])
-
-            # reset the ensemble list once added to the DataFrame
-            self._ensemble_list = []
+        # hand over the available ensembles to the DataFrame
+        #   - the filled rows are copied out of a partly filled buffer, so 
+        #     that the pending rows and the DataFrame do not keep the unused 
+        #     rows of the buffer alive
+        if self._num_ensembles:
+            rows = self.ensemble_list
+            if len(rows) < len(self._buffer):
+                rows = self._allocate(len(rows))
+                rows[:] = self.ensemble_list
+            self._df_parts.append(rows)
+
+            # reset the ensemble buffer once added to the DataFrame
+            self._buffer        = None
+            self._num_ensembles = 0
         else:
             print("WARNING: No ensembles to add to DataFrame.")
 
 
-    def save_as_csv(self, name=None, directory='./'):
+    def _build_df(self, parts, df=None):
+        """Builds the DataFrame of a list of pending ensemble matrices
+
+        Args:
+            parts: list of 2D float arrays, one ensemble data array per row.
+            df: optional existing DataFrame, whose rows come first.
+
+        Returns:
+            pandas DataFrame of the ensembles, with a DatetimeIndex.
+        """
+        # combine the matrices into one column-major matrix, which the new 
+        # DataFrame takes over without a copy
+        #   - the matrix is allocated with _allocate() instead of letting 
+        #     pd.concat() build it, so it stays backed by the buffer 
+        #     directory when there is an existing DataFrame
+        #   - the existing DataFrame keeps its index
+        num_old = 0 if df is None else len(df)
+        if df is not None:
+            parts = [df.to_numpy()] + parts
+        if len(parts) == 1: 
+            data = parts[0]
+        else:
+            data = self._allocate(sum(map(len, parts)))
+            np.concatenate(parts, out=data)
+        index = self.get_datetime_index(data[num_old:, self._index.date_time])
+        if df is not None:
+            index = df.index.append(index)
+        return pd.DataFrame(data=data, index=index, columns=self.label_list,
+                            copy=False)
+
+
+    def save_as_csv(self, name=None, directory='./', compression=None, 
+        chunksize=100000):
         """Saves the DataFrame to csv file. 
 
+        Compressed files keep the .CSV extension followed by the extension 
+        of the compression, such as name.CSV.gz, which from_csv() reads 
+        back without any extra arguments.
+
         Args:
             name: name used when saving the file.
             directory: string directory to save the DataFrame to.
+            compression: optional compression of the file, one of 'gzip', 
+                'bz2', 'zip', 'xz' or 'zstd'.
+            chunksize: number of rows formatted at a time, which bounds the 
+                memory used while writing large DataFrames.
         """
         # update name if not given
         if name is None:
             name = self.name 
-
-        # add ensembles to the DataFrame if they haven't been added yet
-        if self.ensemble_list:
-            self.to_dataframe()
+        if (compression is not None) and \
+           (compression not in self._compression_ext):
+            raise ValueError("bad compression for: save_as_csv(%s)" % 
+                             (compression))
 
         # save DataFrame to csv file
+        #   - accessing df adds ensembles that have not been added yet
+        if self.df is not None:
+            filepath = directory+name+'.CSV'
+            if compression is not None:
+                filepath += self._compression_ext[compression]
+            self.df.to_csv(filepath, compression=compression, 
+                           chunksize=chunksize)
+        else:
+            print("WARNING: No data to save.")
+
+
+    def save_as_parquet(self, name=None, directory='./', compression='zstd'):
+        """Saves the DataFrame to a Parquet file. 
+
+        Parquet stores each column in binary form, so the file is written and 
+        read back with from_parquet() much faster than a CSV file, and it is 
+        much smaller. Requires pyarrow or fastparquet, which pandas uses to 
+        write Parquet files. Use save_as_csv() to share the data as text.
+
+        Args:
+            name: name used when saving the file.
+            directory: string directory to save the DataFrame to.
+            compression: compression of the columns, such as 'zstd', 
+                'snappy', 'gzip' or None.
+        """
+        # update name if not given
+        if name is None:
+            name = self.name 
+
+        # save DataFrame to Parquet file
+        #   - accessing df adds ensembles that have not been added yet
         if self.df is not None:
-            self.df.to_csv(directory+name+'.CSV')
+            self.df.to_parquet(directory+name+'.parquet', 
+                               compression=compression)
         else:
             print("WARNING: No data to save.")
 
@@ -250,30 +459,86 @@ class MicronTimeSeries(MicronSonar):
             bearing_max: the maximum bearing to be included in variable update.
             pad: the amount that the bearing window is shrunk on either side.
         """
-        if (var not in self.label_set):
-            raise ValueError("bad var for: label(%s, %s)" % (var, str(val)))
-        self.df.loc[((self.df.bearing >= bearing_min + pad) & 
-                     (self.df.bearing  < bearing_max - pad)), var] = val
+        self.set_labels_by_bearing((var,), val, bearing_min, bearing_max, pad)
+
+
+    def set_labels_by_bearing(self, var_list, val, bearing_min, bearing_max, 
+        pad=0):
+        """Set several ice labels for a specific range of bearings at once
+
+        The ensembles of the bearing window are found once, and all of the 
+        given labels are set with one assignment, see set_label_by_bearing().
+
+        Args:
+            var_list: sequence of the ice labels to update.
+            val: the value for the ice labels to be set to.
+            bearing_min: the minimum bearing to be included in variable update.
+            bearing_max: the maximum bearing to be included in variable update.
+            pad: the amount that the bearing window is shrunk on either side.
+        """
+        for var in var_list:
+            if (var not in self.label_set):
+                raise ValueError("bad var for: label(%s, %s)" % (var, str(val)))
+
+        # sort the bearings once for each DataFrame, so that the ensembles of
+        # every bearing window are found with a binary search 
+        #   - labeling usually sets many adjacent windows of the same data
+        #   - the order is recomputed when the DataFrame object is replaced, 
+        #     but not when its bearings are modified in place
+        df = self.df
+        if (self._bearing_order is None) or (self._bearing_order[0] is not df):
+            order = np.argsort(df.bearing.values, kind='stable')
+            self._bearing_order = (df, order, df.bearing.values[order])
+        (_, order, bearings) = self._bearing_order
+        lo = np.searchsorted(bearings, bearing_min + pad, side='left')
+        hi = np.searchsorted(bearings, bearing_max - pad, side='left')
+        df.iloc[order[lo:hi], df.columns.get_indexer(var_list)] = val
+
+
+    def get_ice_frame(self):
+        """Returns the ice variables of the DataFrame as categorical columns
+
+        The ice classifications and labels only take a few different values,
+        so grouping and filtering on categorical columns is faster and uses
+        less memory. The DataFrame itself keeps float64 ice columns, so that
+        labels can be set to any value and all of the columns stay one NumPy
+        block that can be viewed without a copy.
+
+        Returns:
+            pandas DataFrame of the ice variables, with categorical columns.
+        """
+        return self.df.loc[:, list(self.ice_vars)].astype('category')
+
+
+    def get_raw_intensity(self):
+        """Returns the intensity bins as the raw values reported by the sonar
+
+        The sonar reports each bin in [0,255], which is converted to [dB]
+        when parsed, so rounding the inverse conversion recovers the raw
+        values exactly. The raw bins take an eighth of the memory of the
+        [dB] bins, for operations that do not need [dB] values.
+
+        Returns:
+            uint8 array of the intensity bins, one row per ensemble.
+        """
+        bins = self.df.iloc[:, self.intensity_index:].to_numpy()
+        return np.rint(bins / self.BIN_TO_DB).astype(np.uint8)
 
 
     def reset_labels(self):
         """Reset the labeled ice parameters to np.nan"""
-        # consider the entire bearing range 
-        bearing_min = -180
-        bearing_max =  180
-        val         =  np.nan
-
-        # extract label variables 
-        labels = [var for var in self.ice_vars if var[:5]=="label"]
-        for label in labels:
-            self.set_label_by_bearing(label, val, bearing_min, bearing_max)
+        # reset the label variables for every ensemble at once 
+        self.df.loc[:, list(self._label_ice_vars)] = np.nan
 
 
     def crop_on_bearing(self, left_angle=-180, right_angle=180,
-        single_swath=False):
+        single_swath=False, copy=True):
         """Crops DataFrame based on bearing value of sonar ensembles.  
 
         Allows the option of down-selecting a single swath from the data file.
+        The cropped DataFrame is copied by default, so labeling it, such as 
+        with set_label_by_bearing(), leaves this DataFrame unchanged. Pass 
+        copy=False to only read the cropped DataFrame without copying it.
 
         Args:
             left_angle: the left-most bearing to be included in the cropped 
@@ -284,6 +549,9 @@ class MicronTimeSeries(MicronSonar):
             
             single_swath: Boolean flag that determines if a single swath is 
                 selected from the DataFrame. 
+
+            copy: Boolean flag that determines if the cropped DataFrame is 
+                copied. Do not modify the cropped DataFrame when it is not.
         """
         if single_swath: 
             name = self.name + '_swath'
@@ -291,20 +559,40 @@ class MicronTimeSeries(MicronSonar):
             name = self.name + '_cropped'
         ts = MicronTimeSeries(name)
 
-        # crop bearing differently depending on relative value of bearings 
-        if right_angle > left_angle:
+        # crop bearing differently depending on relative value of bearings
+        #   - when the bearings are sorted, such as within a single sweep of
+        #     the sonar, the bearing window is a slice found by binary search
+        bearing = self.df.bearing_ref_world
+        if (right_angle > left_angle) and bearing.is_monotonic_increasing:
+            lo = np.searchsorted(bearing.values, left_angle,  side='left')
+            hi = np.searchsorted(bearing.values, right_angle, side='right')
+            ts._df = self.df.iloc[lo:hi]
+        elif right_angle > left_angle:
             ts._df = self.df[(self.df.bearing_ref_world >= left_angle) & 
-                             (self.df.bearing_ref_world <= right_angle)].copy()
+                             (self.df.bearing_ref_world <= right_angle)]
         else: 
             ts._df = self.df[(self.df.bearing_ref_world >= left_angle) | 
-                             (self.df.bearing_ref_world <= right_angle)].copy()
+                             (self.df.bearing_ref_world <= right_angle)]
 
         # down-select one complete swath within the bearing window provided
+        #   - the step size is read by position with iat, a scalar lookup 
+        #     that does not depend on the DatetimeIndex of the DataFrame
         if single_swath:
-            steps  = self.df.steps[0]
-            steps += -0.1
+            steps  = float(self.df['steps'].iat[0]) - 0.1
             swath  = math.ceil(abs(right_angle-left_angle)/steps)*2
-            ts._df = ts.df[:swath]
+            ts._df = ts.df.iloc[:swath]
+
+        # copy the cropped rows, unless they are only read
+        if copy:
+            ts._df = ts.df.copy()
 
         return ts
 
+
+
+def _read_csv_frame(cls, filepath):
+    """Returns the DataFrame of a processed CSV file, see from_csv_directory()
+
+    Defined at module level so that it can be sent to the worker processes.
+    """
+    return cls.from_csv(filepath).df
@@ -0,0 +1,24 @@
+# build_kernels.py
+#
+# Ahead-of-time compiles the Micron Sonar peak width kernel with numba.
+#   - run once with: python build_kernels.py
+#   - creates the micron_kernels extension module next to this file, which
+#     MicronEnsemble uses when it is available, so that the first ensemble
+#     does not pay the numba compile time
+
+import os
+from numba.pycc import CC
+from MicronEnsemble import _peak_width_kernel
+
+
+cc = CC('micron_kernels')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+# peak_width(intensity, max_bin_index, roll_len, conv_len), see
+# MicronEnsemble._peak_width_kernel()
+cc.export('peak_width', 'UniTuple(f8, 2)(f8[:], i8, i8, i8)')(
+    _peak_width_kernel.py_func)
+
+
+if __name__ == '__main__':
+    cc.compile()
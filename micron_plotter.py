@@ -10,71 +10,192 @@ import seaborn as sns
 import matplotlib.cm as cm
 import matplotlib.pyplot as plt
 
+# numba is optional, when it is installed the interpolated points of 
+# plot_polar() are computed with a compiled kernel, otherwise with NumPy
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# style of every plot of this module, set once when the module is imported 
+# instead of resetting the matplotlib settings on every plot
+#   - the backend is not chosen here, so that the plots still show in 
+#     notebooks and interactive sessions, batch scripts can select the Agg 
+#     backend with matplotlib.use('Agg') before importing this module
+sns.set(font_scale = 1.5)
+
+# options of the PNG encoder used by every savefig() call
+#   - a lower zlib compression level than the default of 6 is much faster 
+#     to write, and plots of large flat areas compress almost as well
+_PNG_KW = {'pil_kwargs': {'compress_level': 3, 'optimize': False}}
+
+# range of each intensity bin for each (bin_size, num_bins) setting, see 
+# _bin_ranges()
+_range_cache = {}
+
+# ice category number, legend label and plot color of each ice category, 
+# see plot_incidence_curves()
+_ICE_CATEGORIES = (
+    (0,  'Water',           'tab:blue'),
+    (10, 'Marginal Ice',    'tab:orange'),
+    (20, 'Frazil Ice',      'tab:pink'),
+    (21, 'Slushy Ice',      'tab:pink'),
+    (22, 'Smooth Thin Ice', 'tab:red'),
+    (23, 'Rough Thin Ice',  'tab:red'),
+    (30, 'Smooth Thick Ice','tab:brown'),
+    (31, 'Rough Thick Ice', 'tab:brown'),
+    (32, 'Pressure Ridge ', 'tab:gray')
+)
+_CATEGORIES = {num : label for (num, label, color) in _ICE_CATEGORIES}
+_PALETTE    = {num : color for (num, label, color) in _ICE_CATEGORIES}
+
+# abbreviated month names used in plot titles, indexed by month - 1
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
+           'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
 
 
 def plot_ensemble(ensemble, location, output_file=None):
     """Plots and Intensity in dB vs. Distance from transducer in meters
     
     Also highlights the peak width selection, which is one of the primary
-    features used for classifying different ice situations. 
+    features used for classifying different ice situations. To plot many 
+    ensembles, use EnsemblePlotter instead, which reuses one figure.
     
     Args: 
         ensemble: a Micron Ensemble to be visualized.
         location: string location where the data was collected.
         output_file: save name for the generated plot.
     """
-    # constants 
-    deg_in_quadrant = 90
-    ylim_max        = 25
+    # the figure is closed once it is plotted, so without an output file 
+    # the plot would never be seen
+    if not output_file:
+        return
 
-    if ensemble.peak_width_bin == 0:  peak_alpha = 0
-    else:                             peak_alpha = 0.3
+    # plot the ensemble and save the file
+    plotter = EnsemblePlotter(location)
+    plotter.update(ensemble)
+    plotter.save(output_file)
+    plotter.close()
 
-    months = {1:'Jan', 2:'Feb', 3:'Mar', 4:'Apr',  5:'May',  6:'Jun',
-              7:'Jul', 8:'Aug', 9:'Sep',10:'Oct', 11:'Nov', 12:'Dec'}
 
-    # generate plots
-    sns.set(font_scale = 1.5)
-    fig, ax = plt.subplots(figsize=(15,8))
-    ax.plot(ensemble.intensity_data, linewidth=3, color='tab:blue')
-    plt.axvspan(ensemble.peak_start_bin, ensemble.peak_end_bin, 
-        alpha=peak_alpha, color='tab:purple')
-
-    # generate titles 
-    fig.suptitle('Micron Sonar Ensemble, %s, %i %s %i' % 
-                    (location, ensemble.day, months[ensemble.month], 
-                     ensemble.year), 
-                 fontsize=22, fontweight='bold')
 
-    incidence = "Incidence: %3i$^\circ$   " % (abs(ensemble.bearing_ref_world))
-    bearing   = "Bearing: %3i$^\circ$   "   % (ensemble.bearing)
-    intensity = "Intensity: %2d dB   "      % (ensemble.max_intensity)
-    peak      = "Peak Width: %.2f m"        % (ensemble.peak_width)
+class EnsemblePlotter(object):
+    """Plots Micron Ensembles one after the other on the same figure
 
-    ax.set_title(incidence+bearing+intensity+peak, 
-        fontsize=18, fontname='Courier New')
+    Creating a figure and its axes is a large part of the cost of plotting 
+    one ensemble, so the figure is created once and only the parts that 
+    depend on the ensemble are replaced by update(), see plot_ensemble().
 
-    # generate ticks and label axes 
+    For example, to save a plot of every ensemble of a list:
+
+        plotter = EnsemblePlotter('Woods Hole MA')
+        for (i, ensemble) in enumerate(ensembles):
+            plotter.update(ensemble)
+            plotter.save('ensemble_%d' % (i))
+        plotter.close()
+    """
+    # the figure, its axes and the artists replaced by update()
+    __slots__ = ('_location', '_fig', '_ax', '_line', '_span')
+
+    # constants 
+    ylim_max  = 25
     num_ticks = 11
-    xticks = np.arange(0, ensemble.dbytes, ensemble.dbytes/(num_ticks-1))
-    xticks = np.append(xticks, ensemble.dbytes)
-    xtick_labels = ["%.1f" % (e*ensemble.bin_size) for e in xticks]
-    ax.set_ylim(0, ylim_max)
-    ax.set_xticks(xticks)
-    ax.set_xticklabels(xtick_labels)
-    ax.set_xlabel('Distance from Transducer [m]')
-    ax.set_ylabel('Intensity [dB]')
-    ax.legend(['Intensity', 'Rolling Median','FWHM'], loc='best')
 
-    # save the file if specified
-    if output_file:
-        plt.savefig("../figs/%s.png" % (output_file))
-    plt.close()
+    def __init__(self, location):
+        """Constructor of the figure used to plot each ensemble
+
+        Args: 
+            location: string location where the data was collected.
+        """
+        self._location = location
+
+        # generate the figure and the parts that are the same for every 
+        # ensemble
+        self._fig, self._ax = plt.subplots(figsize=(15,8))
+        (self._line,) = self._ax.plot([], [], linewidth=3, color='tab:blue')
+        self._span    = None
+        self._ax.set_xlabel('Distance from Transducer [m]')
+        self._ax.set_ylabel('Intensity [dB]')
+
+
+    @property
+    def fig(self):
+        return self._fig
+
+    @property
+    def ax(self):
+        return self._ax
+
+
+    def update(self, ensemble):
+        """Replaces the plotted ensemble with the given ensemble
+
+        Args: 
+            ensemble: a Micron Ensemble to be visualized.
+        """
+        ax = self._ax
+        if ensemble.peak_width_bin == 0:  peak_alpha = 0
+        else:                             peak_alpha = 0.3
+
+        # replace the plotted intensity and the peak width selection
+        #   - the span of the previous ensemble is removed, since its type 
+        #     depends on the version of matplotlib
+        intensity = ensemble.intensity_data
+        self._line.set_data(np.arange(len(intensity)), intensity)
+        if self._span is not None:
+            self._span.remove()
+        self._span = ax.axvspan(ensemble.peak_start_bin, ensemble.peak_end_bin,
+            alpha=peak_alpha, color='tab:purple')
+        ax.relim()
+        ax.autoscale_view()
+
+        # generate titles 
+        #   - the variables are floats, which are truncated to integers as the
+        #     %i format does
+        #   - suptitle() and set_title() reuse the text of the previous title
+        month = _MONTHS[int(ensemble.month) - 1]
+        self._fig.suptitle(
+            f'Micron Sonar Ensemble, {self._location}, {int(ensemble.day)} '
+            f'{month} {int(ensemble.year)}', 
+            fontsize=22, fontweight='bold')
+
+        incidence = f"Incidence: {int(ensemble.incidence_angle):3d}$^\\circ$   "
+        bearing   = f"Bearing: {int(ensemble.bearing):3d}$^\\circ$   "
+        intensity = f"Intensity: {int(ensemble.max_intensity):2d} dB   "
+        peak      = f"Peak Width: {ensemble.peak_width:.2f} m"
+
+        ax.set_title(incidence+bearing+intensity+peak, 
+            fontsize=18, fontname='Courier New')
+
+        # generate ticks, which depend on the number and size of the bins
+        num_ticks = self.num_ticks
+        xticks = np.arange(0, ensemble.dbytes, ensemble.dbytes/(num_ticks-1))
+        xticks = np.append(xticks, ensemble.dbytes)
+        xtick_labels = ["%.1f" % (e*ensemble.bin_size) for e in xticks]
+        ax.set_ylim(0, self.ylim_max)
+        ax.set_xticks(xticks)
+        ax.set_xticklabels(xtick_labels)
+        ax.legend(['Intensity', 'Rolling Median','FWHM'], loc='best')
+
+
+    def save(self, output_file):
+        """Saves the plot of the current ensemble
+
+        Args: 
+            output_file: save name for the generated plot.
+        """
+        self._fig.savefig("../figs/%s.png" % (output_file), **_PNG_KW)
+
+
+    def close(self):
+        """Closes the figure, the plotter cannot be used afterwards"""
+        plt.close(self._fig)
 
 
 
 def plot_polar(time_series, separator=None, pad=0.2, output_file=None, 
-    sonar_depth=None):
+    sonar_depth=None, cells=None):
     """Generates a plot in polar coordinates of a Micron Time-Series
 
     It is recommended to first crop the time series such that only one swath 
@@ -86,73 +207,115 @@ def plot_polar(time_series, separator=None, pad=0.2, output_file=None,
         separator: bearing angle separation between two different ice types.
         pad: half the angular width of the separator when visualized
         output_file: save name for the generated plot.
+        sonar_depth: depth in [m] of the sonar, which sets the maximum range
+            of the plot.
+        cells: optional tuple of (num_bearing_cells, num_range_cells), which
+            plots the mean intensity of each cell of a polar grid instead of
+            every point. Recommended for dense swaths.
     """
     depth_factor  = time_series.REFLECTION_FACTOR
     deg_to_rad    = time_series.DEG_TO_RAD
     min_depth     = time_series.BLANKING_DISTANCE
     ultra_steps   = 0.9
     deg_in_circle = 360
-    bin_size      = time_series.df['bin_size'][0]
-    steps         = time_series.df['steps'][0]
+    bin_size      = time_series.df['bin_size'].iat[0]
+    steps         = time_series.df['steps'].iat[0]
     interpolation = int(steps/ultra_steps) - 1
 
     # plot only first swath 
-    swath = time_series.crop_on_bearing(single_swath=True)     
+    #   - the swath is only read, so the cropped rows are not copied
+    swath = time_series.crop_on_bearing(single_swath=True, copy=False)
 
     # filter out appropriate ranges 
     bin_idx     = swath.intensity_index
-    bin_labels  = swath.df.columns[bin_idx:]
-    sub_cols    = ['bearing_ref_world'] + list(bin_labels)
-    df          = swath.df[sub_cols]
-
-    # melt data-frame into three columns: bearing, range, intensity 
-    new_cols   = ['bearing_ref_world'] + \
-                 [int(label[4:])*bin_size for label in bin_labels]
-    df.columns = new_cols
-    df = pd.melt(df, id_vars=['bearing_ref_world'], var_name='range',
-                 value_name='intensity')
-
-    # collected interpolated data in a list of new data frames 
-    frames = []
-    unique_bearings = sorted(list(set(df.bearing_ref_world)))
-
-    # parse the left and right bearing increments to interpolate between them
-    for i in range(len(unique_bearings)-1):
-        df_left  = df[df.bearing_ref_world==unique_bearings[i]]
-        df_right = df[df.bearing_ref_world==unique_bearings[i+1]]
-        intensity_left  = np.array(df_left.intensity)
-        
-        # interpolate between the left and the right side if same size
-        try:
-            intensity_delta = np.array(df_right.intensity) - np.array(df_left.intensity)
-        except ValueError:
-            intensity_delta = np.zeros(len(intensity_left))
-        
-        # interpolate to match resolution of the ultra-high setting 
-        for j in range(1, interpolation+1):
-            new_angle      = unique_bearings[i] + j*ultra_steps
-            range_data     = np.array(df_left.range)
-            bearing_data   = new_angle*np.ones(len(range_data))
-            intensity_data = intensity_left + (j/interpolation)*intensity_delta
-            frames.append(pd.DataFrame(
-                data={'bearing_ref_world' : bearing_data,
-                      'range'             : range_data,
-                      'intensity'         : intensity_data})
-            )
+    intensity   = swath.df.iloc[:, bin_idx:].to_numpy()
+    bearings    = swath.df['bearing_ref_world'].to_numpy()
+    ranges      = _bin_ranges(bin_size, intensity.shape[1])
+
+    # flatten the swath into three arrays: bearing, range, intensity 
+    #   - the points are ordered one bin at a time, as melting the swath 
+    #     DataFrame on the bearing would, without building a DataFrame
+    num_rows         = len(bearings)
+    bearing_points   = np.tile(bearings, len(ranges))
+    range_points     = np.repeat(ranges, num_rows)
+    intensity_points = intensity.ravel(order='F')
+
+    # group the ensembles by bearing to interpolate between adjacent bearings
+    #   - the sort is stable, so ensembles of the same bearing keep their 
+    #     order within the group
+    order       = np.argsort(bearings, kind='stable')
+    grid        = intensity[order]
+    (unique_bearings, starts, counts) = np.unique(
+        bearings[order], return_index=True, return_counts=True)
+
+    # interpolate to match resolution of the ultra-high setting 
+    (new_bearing, new_range, new_intensity) = _interpolate_swath(
+        grid, starts, counts, unique_bearings, ranges, interpolation, 
+        ultra_steps)
 
     # combine interpolated data and given data 
-    df = pd.concat([df] + frames)
+    bearing_points   = np.concatenate((bearing_points,   new_bearing))
+    range_points     = np.concatenate((range_points,     new_range))
+    intensity_points = np.concatenate((intensity_points, new_intensity))
+
+    # drop the points beyond the maximum range of the plot
+    #   - set_rmax() would hide them, so they are not drawn at all
+    #   - the color scale still spans every point, so the colors and the 
+    #     colorbar are the same as with all of the points
+    color_min = np.min(intensity_points)
+    color_max = np.max(intensity_points)
+    if sonar_depth: 
+        visible          = range_points <= sonar_depth*depth_factor
+        bearing_points   = bearing_points[visible]
+        range_points     = range_points[visible]
+        intensity_points = intensity_points[visible]
 
     # initialize plot format 
-    sns.set(font_scale = 1.5)
-    fig = plt.figure(figsize=(15,15))
-    ax  = fig.add_subplot(111, projection='polar')
+    fig   = plt.figure(figsize=(15,15))
+    ax    = fig.add_subplot(111, projection='polar')
     ax.set_xticks(deg_to_rad * np.linspace(180,  -180, 24, endpoint=False))
-
-    # plot the data 
-    area = np.asarray(100*df['range'] + 10).astype(np.float64)
-    img  = ax.scatter(df['bearing_ref_world']*deg_to_rad, df['range'], s=area, 
-                      c=df['intensity'],cmap='viridis')
+    theta = np.deg2rad(bearing_points)
+
+    # plot the data as one marker per point
+    #   - the color of each point is the uint8 index of the colormap entry 
+    #     that matplotlib would pick for its intensity, so the colors are 
+    #     unchanged and only one byte per point is passed to scatter()
+    #   - the colorbar ticks are placed at the index of each dB value
+    #   - the points are rasterized, so that a vector output such as PDF or 
+    #     SVG stores one image instead of a path for every point
+    if cells is None:
+        num_colors  = 256    # number of entries of the viridis colormap
+        color_range = color_max - color_min
+        if color_range > 0:
+            color_index = (intensity_points - color_min)/color_range*num_colors
+            color_scale = num_colors/color_range
+        else: 
+            color_index = np.zeros(len(intensity_points))
+            color_scale = 0
+        color_index = np.clip(color_index, 0, num_colors-1).astype(np.uint8)
+        area = 100*range_points + 10
+        img  = ax.scatter(theta, range_points, s=area, c=color_index, 
+                          cmap='viridis', vmin=0, vmax=num_colors, 
+                          rasterized=True)
+
+    # plot the data as the mean intensity of each cell of a polar grid
+    #   - dense swaths put many points in the same cell, so drawing one 
+    #     quadrilateral per cell is much faster than one marker per point
+    #   - cells without any point are left empty
+    else:
+        (num_theta, num_r) = cells
+        theta_edges = np.linspace(-np.pi, np.pi, num_theta+1)
+        range_edges = np.linspace(0, np.max(range_points), num_r+1)
+        (counts, _, _) = np.histogram2d(
+            theta, range_points, bins=(theta_edges, range_edges))
+        (totals, _, _) = np.histogram2d(
+            theta, range_points, bins=(theta_edges, range_edges), 
+            weights=intensity_points)
+        mean = np.full(counts.shape, np.nan)
+        np.divide(totals, counts, out=mean, where=counts > 0)
+        img  = ax.pcolormesh(theta_edges, range_edges, mean.T, cmap='viridis',
+                             vmin=color_min, vmax=color_max, shading='flat',
+                             rasterized=True)
 
     if sonar_depth: 
         ax.set_rmax(sonar_depth*depth_factor)
@@ -165,10 +328,14 @@ def plot_polar(time_series, separator=None, pad=0.2, output_file=None,
     # set colorbar ticks and labels 
     fraction    = 0.025
     increment   = 5
-    cbar_max    = math.ceil(np.max(df['intensity'])/increment)*increment
+    cbar_max    = math.ceil(color_max/increment)*increment
     cbar_ticks  = range(0,cbar_max,increment)
     cbar_labels = ["%2d dB" %(i) for i in cbar_ticks]
-    cbar = fig.colorbar(img, fraction=fraction, ticks=cbar_ticks)
+    if cells is None: 
+        cbar_index = [(i - color_min)*color_scale for i in cbar_ticks]
+    else:             
+        cbar_index = cbar_ticks
+    cbar = fig.colorbar(img, fraction=fraction, ticks=cbar_index)
     cbar.ax.set_yticklabels(cbar_labels)
 
     # add orange divider at the boundary 
@@ -177,9 +344,132 @@ def plot_polar(time_series, separator=None, pad=0.2, output_file=None,
                     (separator+pad)*deg_to_rad,         
                     color='tab:orange', alpha=0.6)
         
-    # save the figure
-    # if output_file: 
-    plt.savefig('/Users/zduguid/Desktop/dat/tmp-polar.png')
+    # save the figure if specified
+    if output_file: 
+        plt.savefig("../figs/%s.png" % (output_file), **_PNG_KW)
+
+
+
+def _bin_ranges(bin_size, num_bins):
+    """Returns the range in [m] of each intensity bin
+
+    The ranges only depend on the sonar setting, so they are computed once 
+    for each setting and cached. The cached array is read-only, as it is 
+    shared between plots.
+
+    Args:
+        bin_size: size of each bin, in [m].
+        num_bins: the number of intensity bins.
+
+    Returns:
+        read-only float array of the range of each bin.
+    """
+    key = (float(bin_size), num_bins)
+    if key not in _range_cache:
+        ranges = np.arange(num_bins)*key[0]
+        ranges.flags.writeable = False
+        _range_cache[key] = ranges
+    return _range_cache[key]
+
+
+def _interpolate_swath_numpy(grid, starts, counts, bearings, ranges, 
+    interpolation, ultra_steps):
+    """Interpolates the intensity bins between adjacent bearings of a swath
+
+    Each ensemble is interpolated towards the ensemble at the same position 
+    of the next bearing when both bearings have the same number of ensembles,
+    otherwise it is repeated without a change in intensity. Every new point 
+    is computed at once, in the order that looping over each pair of 
+    bearings, each step and each bin would add them.
+
+    Args:
+        grid: 2D float array of intensity bins, one row per ensemble, with 
+            the ensembles sorted by bearing.
+        starts: the first row of each bearing in grid.
+        counts: the number of rows of each bearing in grid.
+        bearings: the sorted unique bearings, in [deg].
+        ranges: the range of each bin, in [m].
+        interpolation: the number of new bearings between adjacent bearings.
+        ultra_steps: the angular step size between new bearings, in [deg].
+
+    Returns:
+        Tuple of (bearing, range, intensity) arrays of the new points.
+    """
+    # change in intensity towards the next bearing of each ensemble
+    num_pairs   = len(bearings) - 1
+    group       = np.repeat(np.arange(len(bearings)), counts)
+    same_count  = np.append(counts[:-1] == counts[1:], False)
+    paired      = np.flatnonzero(same_count[group])
+    delta       = np.zeros_like(grid)
+    delta[paired] = grid[paired + counts[group[paired]]] - grid[paired]
+
+    # position of every new point in the loop over pairs, steps and bins
+    #   - block_len is the number of new points between each pair of bearings
+    num_bins    = len(ranges)
+    step_list   = np.arange(1, interpolation+1)
+    block_len   = len(step_list)*num_bins*counts[:-1]
+    pair        = np.repeat(np.arange(num_pairs), block_len)
+    local       = np.arange(np.sum(block_len)) - \
+                  np.repeat(np.cumsum(block_len) - block_len, block_len)
+    count       = counts[pair]
+    step        = local // (num_bins*count)
+    bin_index   = (local // count) % num_bins
+    row         = starts[pair] + local % count
+    new_bearing = bearings[pair] + step_list[step]*ultra_steps
+    new_range   = ranges[bin_index]
+    new_intensity = grid[row, bin_index] + \
+                    (step_list[step]/interpolation)*delta[row, bin_index]
+    return new_bearing, new_range, new_intensity
+
+
+def _interpolate_swath_kernel(grid, starts, counts, bearings, ranges, 
+    interpolation, ultra_steps):
+    """Interpolates the intensity bins between adjacent bearings of a swath
+
+    Same result as _interpolate_swath_numpy(), written as loops for numba. 
+    Each pair of bearings writes its own block of the output in parallel, 
+    and no temporary array the size of the output is allocated.
+    """
+    num_pairs = len(bearings) - 1
+    num_bins  = len(ranges)
+    num_steps = max(interpolation, 0)
+
+    # first output point of each pair of bearings
+    offsets = np.zeros(max(num_pairs, 0) + 1, dtype=np.int64)
+    for i in range(num_pairs):
+        offsets[i+1] = offsets[i] + num_steps*num_bins*counts[i]
+    new_bearing   = np.empty(offsets[-1])
+    new_range     = np.empty(offsets[-1])
+    new_intensity = np.empty(offsets[-1])
+
+    for i in _prange(num_pairs):
+        count  = counts[i]
+        start  = starts[i]
+        paired = counts[i+1] == count
+        k      = offsets[i]
+        for j in range(1, num_steps+1):
+            angle  = bearings[i] + j*ultra_steps
+            weight = j/interpolation
+            for b in range(num_bins):
+                for p in range(count):
+                    left = grid[start+p, b]
+                    if paired: delta = grid[start+count+p, b] - left
+                    else:      delta = 0.0
+                    new_bearing[k]   = angle
+                    new_range[k]     = ranges[b]
+                    new_intensity[k] = left + weight*delta
+                    k += 1
+    return new_bearing, new_range, new_intensity
+
+
+# select the interpolation implementation depending on numba availability
+if numba is not None:
+    _prange            = numba.prange
+    _interpolate_swath = numba.njit(cache=True, parallel=True)(
+        _interpolate_swath_kernel)
+else:
+    _prange            = range
+    _interpolate_swath = _interpolate_swath_numpy
 
 
 
@@ -192,60 +482,41 @@ def plot_incidence_curves(time_series, variable_size=False, output_file=None,
         variable_size: boolean flag to plot points with varying size.
         output_file: save name for the generated plot.        
     """
-    sns.set(font_scale = 1.5)
     fig, ax = plt.subplots(figsize=(15,8))
     pad_x = 2
     pad_y = 2
     y_max = 60
     x_max = 60
 
-    def is_number(s):
-        try:
-            float(s)
-            return True
-        except ValueError:
-            return False
-        
-    def is_valid_label(s):
-        return(is_number(s) and (float(s) in categories.keys()))
-
     def get_legend_items(handles, labels):
-        valid = [is_valid_label(label) for label in labels]
-        if False in valid[1:]:
-            valid_index = valid[1:].index(False) + 1
+        # keep the legend items up to the first label that is not the number
+        # of an ice category, after the title item
+        #   - the labels are parsed at once, non-numeric labels become NaN
+        values  = pd.to_numeric(pd.Series(labels[1:], dtype=object), 
+                                errors='coerce')
+        invalid = np.flatnonzero(~values.isin(_CATEGORIES.keys()).to_numpy())
+        if len(invalid):
+            valid_index = invalid[0] + 1
         else: 
             valid_index = len(labels)
-        new_labels  = [categories[float(l)] for l in labels[1:valid_index]]
-        new_handles = [handles[i] for i in range(1,valid_index)]
+        new_labels  = [_CATEGORIES[v] for v in values.iloc[:valid_index-1]]
+        new_handles = handles[1:valid_index]
         return(new_handles, new_labels)
 
-    ice_categories = [
-        (0,  'Water',           'tab:blue'),
-        (10, 'Marginal Ice',    'tab:orange'),
-        (20, 'Frazil Ice',      'tab:pink'),
-        (21, 'Slushy Ice',      'tab:pink'),
-        (22, 'Smooth Thin Ice', 'tab:red'),
-        (23, 'Rough Thin Ice',  'tab:red'),
-        (30, 'Smooth Thick Ice','tab:brown'),
-        (31, 'Rough Thick Ice', 'tab:brown'),
-        (32, 'Pressure Ridge ', 'tab:gray')
-    ]
-
-    categories = {num : label for (num, label, color) in ice_categories}
-    palette    = {num : color for (num, label, color) in ice_categories}
-
     if variable_size: size = time_series.df.peak_width
     else:             size = None
 
     # plot scatter plot of incidence angle and intensity values
+    #   - the points are rasterized, as in plot_polar()
     ax = sns.scatterplot(
         x=time_series.df.incidence_angle, 
         # y=time_series.df.max_intensity_norm,
         y=time_series.df.max_intensity,
         size=size,
         hue=time_series.df.label_ice_category,
-        palette=palette,
-        legend='brief'
+        palette=_PALETTE,
+        legend='brief',
+        rasterized=True
     )
 
     # set titles and labels
@@ -263,9 +534,9 @@ def plot_incidence_curves(time_series, variable_size=False, output_file=None,
     new_handles, new_labels = get_legend_items(handles,labels)
     ax.legend(new_handles, new_labels, title='Ice Category', loc='lower left')
 
-    # save the figure
-    # if output_file: plt.savefig("../figs/%s.png" % (output_file))
-    plt.savefig('/Users/zduguid/Desktop/fig/tmp-incidence.png')
+    # save the figure if specified
+    if output_file: 
+        plt.savefig("../figs/%s.png" % (output_file), **_PNG_KW)
 
 
 